@@ -1,45 +1,122 @@
 from google.cloud import bigquery
 from pandas import DataFrame
 
-from util import dataframe_to_jsonl
+from util import ParameterizedQuery, arrow_types_mapper, dataframe_to_jsonl
 from envManager import get_service_account_key_path
 from query import project_id, dataset_id
+from queryCache import QueryCache
 
 # クライアントの初期化
 service_account_key_path = get_service_account_key_path()
 client = bigquery.Client.from_service_account_json(service_account_key_path)
 
+# クエリ結果のローカルキャッシュ（configure_query_cache で有効化するまでは使わない）
+query_cache = None
 
-def fetch_table_data(query=None) -> DataFrame:
+
+def configure_query_cache(directory, ttl, max_bytes) -> QueryCache:
+    """
+    fetch_table_data のローカルキャッシュを有効化する関数
+
+    Args:
+        directory (str): キャッシュの保存先ディレクトリ
+        ttl (int): 通常のエントリの有効期限（秒）
+        max_bytes (int): キャッシュの最大合計サイズ（バイト）
+
+    Returns:
+        QueryCache: 有効化したキャッシュ
+    """
+    global query_cache
+    query_cache = QueryCache(directory, ttl=ttl, max_bytes=max_bytes)
+    return query_cache
+
+
+def fetch_table_data(
+    query: ParameterizedQuery, cache=False, immutable=False
+) -> DataFrame:
     """
     サービスアカウントを使用してBigQueryからデータを取得する関数
 
     Args:
-        query (str): 実行するクエリ。Noneの場合は全データを取得
+        query (ParameterizedQuery): 実行するクエリとクエリパラメータ
+        cache (bool): True かつキャッシュが有効な場合、ローカルキャッシュを使う
+            （結果が自分の書き込みで変わるクエリには使わないこと）
+        immutable (bool): 結果が今後変わらない場合（過去日など）は True。キャッシュを期限切れにしない
 
     Returns:
         pandas.DataFrame: テーブルデータ
     """
+    use_cache = cache and query_cache is not None
+    if use_cache:
+        cached_dataframe = query_cache.get(query.cache_key())
+        if cached_dataframe is not None:
+            return cached_dataframe
 
     # クエリの実行
-    query_job = client.query(query)
+    query_job = client.query(
+        query.sql,
+        job_config=bigquery.QueryJobConfig(query_parameters=query.parameters),
+    )
 
-    # 結果をデータフレームとして取得
+    # 結果をArrow経由でデータフレームとして取得
+    # 文字列は string[pyarrow]、タイムスタンプは datetime64[us, UTC] のまま保持する
     result = query_job.result()
-    result_dataframe = result.to_dataframe()
-    result_dataframe = format_datetime_column(result_dataframe, "snippet_publishedAt")
+    result_dataframe = result.to_arrow().to_pandas(
+        types_mapper=arrow_types_mapper, split_blocks=True, self_destruct=True
+    )
+
+    if use_cache:
+        query_cache.put(query.cache_key(), result_dataframe, immutable=immutable)
 
     return result_dataframe
 
 
-def load_dataframe_to_bigquery(dataframe: DataFrame, table_id: str) -> None:
+def execute_query(query: ParameterizedQuery) -> None:
+    """
+    結果を返さないクエリ（UPDATE などの DML）を実行し、完了を待つ関数
+
+    Args:
+        query (ParameterizedQuery): 実行するクエリとクエリパラメータ
+
+    Returns:
+        None
+    """
+    query_job = client.query(
+        query.sql,
+        job_config=bigquery.QueryJobConfig(query_parameters=query.parameters),
+    )
+    query_job.result()
+
+
+def dry_run_query(query: ParameterizedQuery) -> int:
+    """
+    クエリをドライランし、スキャンされるバイト数を返す関数（課金されない）
+
+    Args:
+        query (ParameterizedQuery): 実行するクエリとクエリパラメータ
+
+    Returns:
+        int: スキャンされるバイト数
+    """
+    query_job = client.query(
+        query.sql,
+        job_config=bigquery.QueryJobConfig(
+            query_parameters=query.parameters, dry_run=True, use_query_cache=False
+        ),
+    )
+    return query_job.total_bytes_processed
+
+
+def load_dataframe_to_bigquery(
+    dataframe: DataFrame, table_id: str, dataset_id: str = dataset_id
+) -> None:
     """
     DataFrameをBigQueryに書き込む関数
 
     Args:
         dataframe (pandas.DataFrame): 書き込むデータフレーム
         table_id (str): 書き込み先のBigQueryテーブルID
-            (例: "project_id.dataset_id.table_id")
+        dataset_id (str): 書き込み先のデータセットID（既定: query.dataset_id）
 
     Returns:
         None
@@ -62,25 +139,11 @@ def load_dataframe_to_bigquery(dataframe: DataFrame, table_id: str) -> None:
         job_config=bigquery.LoadJobConfig(
             source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
             autodetect=True,  # 自動でスキーマ推定（指定も可能）
+            # サンプリング時の sampled / sampling_weight など、列の追加を許可する
+            schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION],
         ),
     )
 
     # ジョブの完了を待機
     job.result()
 
-
-def format_datetime_column(dataframe: DataFrame, column_name: str) -> DataFrame:
-    """
-    指定された列の datetime64[us, UTC] データを ISO 8601 フォーマットに変換する関数
-
-    Args:
-        dataframe (pandas.DataFrame): 対象のデータフレーム
-        column_name (str): 対象の列名
-    Returns:
-        pandas.DataFrame: フォーマットが適用されたデータフレーム
-    """
-    if column_name in dataframe.columns:
-        dataframe[column_name] = dataframe[column_name].dt.strftime(
-            "%Y-%m-%dT%H:%M:%S.%f%z"
-        )
-    return dataframe
@@ -1,9 +1,14 @@
 import torch
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from collections.abc import Callable
 from tqdm import tqdm
 
+from emotionModel import register_model
+from profileManager import profile_stage
+from util import build_result_frame
+
 from transformers import pipeline
 from transformers import (
     AutoModelForSequenceClassification,
@@ -54,20 +59,47 @@ def convert_emotion_bert(
     if data.empty:
         return pd.DataFrame()
 
-    # データフレームをコピー
-    result_data = data.copy()
+    def process_row(text):
+        with profile_stage("bert-reference-score"):
+            return function(text)
 
     # 各行に対して処理を加える
-    result_data["label"], result_data["score"] = zip(
+    labels, scores = zip(
         *[
-            function(x)
-            for x in tqdm(result_data["snippet_displayMessage"], desc="Processing rows")
+            process_row(x)
+            for x in tqdm(data["snippet_displayMessage"], desc="Processing rows")
         ]
     )
 
-    result_data = result_data.drop(columns=["snippet_displayMessage"])  # 不要な列を削除
-    result_data = result_data.rename(
-        columns={"snippet_publishedAt": "publishedAt"}
-    )  # 列名を変更
+    # 入力をコピーせず、列の追加だけで結果を組み立てる
+    with profile_stage("bert-reference-assemble"):
+        result_data = build_result_frame(data)
+        result_data["label"] = pd.array(labels, dtype="string[pyarrow]")
+        result_data["score"] = np.asarray(scores, dtype=np.float32)
 
     return result_data
+
+
+@register_model("bert")
+class BertEmotionModel:
+    """BERTを用いた感情分析モデル（EmotionModel）"""
+
+    name = "bert"
+    table_id = "bert_emotion"
+    output_schema = {"label": "string[pyarrow]", "score": "float32"}
+
+    def __init__(self):
+        # GPUを指定した場合は、処理が高速になる
+        device = 0 if torch.cuda.is_available() else -1
+        self.classifier = pipeline(
+            "sentiment-analysis", model=model, tokenizer=tokenizer, device=device
+        )
+
+    def score(self, texts: list[str]) -> dict[str, list]:
+        # トークナイズと推論はパイプライン内で行われる
+        with torch.profiler.record_function("bert-pipeline"):
+            results = self.classifier(texts, batch_size=len(texts), truncation=True)
+        return {
+            "label": [result["label"] for result in results],
+            "score": [result["score"] for result in results],
+        }
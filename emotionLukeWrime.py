@@ -1,9 +1,14 @@
 import torch
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from collections.abc import Callable
 from tqdm import tqdm
 
+from emotionModel import register_model
+from profileManager import profile_stage
+from util import build_result_frame
+
 from transformers import AutoTokenizer, AutoModelForSequenceClassification, LukeConfig
 
 tokenizer = AutoTokenizer.from_pretrained(
@@ -19,7 +24,17 @@ model = AutoModelForSequenceClassification.from_pretrained(
 )
 max_seq_length = 512
 
-tqdm.pandas()  # tqdmをpandasに統合
+# ロジットの列順（モデルの出力順）
+luke_wrime_score_columns = [
+    "luke_wrime_score_joy",
+    "luke_wrime_score_sadness",
+    "luke_wrime_score_anticipation",
+    "luke_wrime_score_surprise",
+    "luke_wrime_score_anger",
+    "luke_wrime_score_fear",
+    "luke_wrime_score_disgust",
+    "luke_wrime_score_trust",
+]
 
 
 # def calc_emotion_luke_wrime_demo(text: str) -> tuple:  # (label, score)
@@ -41,9 +56,11 @@ def calc_emotion_luke_wrime(text: str) -> tuple:  # (label, score)
     input_ids = torch.tensor(token["input_ids"]).unsqueeze(0).to(device)
     attention_mask = torch.tensor(token["attention_mask"]).unsqueeze(0).to(device)
 
-    output = model(input_ids, attention_mask)
+    # 推論のみなので勾配を保持しない
+    with torch.no_grad():
+        output = model(input_ids, attention_mask)
     max_index = torch.argmax(output.logits, dim=1).item()
-    index = output.logits.cpu().detach().numpy()  # 必要に応じてCPUに戻す
+    index = output.logits.cpu().numpy()  # 必要に応じてCPUに戻す（float32）
     return max_index, index
 
 
@@ -63,44 +80,63 @@ def convert_emotion_luke_wrime(
     if data.empty:
         return pd.DataFrame()
 
-    # データフレームをコピー
-    result_data = data.copy()
-
-    def process_row(text):
-        max_sentiment_index, sentiment_index = function(text)
-        torch.set_printoptions(
-            precision=17,  # 有効桁数（float64なら最大17桁程度）
-            threshold=float("inf"),  # 要素数が多くても省略しない
-            linewidth=200,  # 1行に表示する最大幅（改行を防ぐ）
-            sci_mode=False,  # 科学的記法（指数表記）を使わない
-        )
-
-        return pd.Series(
-            {
-                "luke_wrime_score_joy": float(sentiment_index[0][0]),
-                "luke_wrime_score_sadness": float(sentiment_index[0][1]),
-                "luke_wrime_score_anticipation": float(sentiment_index[0][2]),
-                "luke_wrime_score_surprise": float(sentiment_index[0][3]),
-                "luke_wrime_score_anger": float(sentiment_index[0][4]),
-                "luke_wrime_score_fear": float(sentiment_index[0][5]),
-                "luke_wrime_score_disgust": float(sentiment_index[0][6]),
-                "luke_wrime_score_trust": float(sentiment_index[0][7]),
-                "luke_wrime_index": int(max_sentiment_index),
-            }
-        )
-
-    # 各行のsnippet_displayMessageを処理し、結果を新しいデータフレームに格納
-    processed_data = result_data["snippet_displayMessage"].progress_apply(process_row)
-
-    # 元のデータフレームに計算結果を結合
-    result_data = pd.concat([result_data, processed_data], axis=1)
-
-    result_data = result_data.drop(columns=["snippet_displayMessage"])  # 不要な列を削除
-    result_data = result_data.rename(
-        columns={"snippet_publishedAt": "publishedAt"}
-    )  # 列名を変更
-    result_data["luke_wrime_index"] = result_data["luke_wrime_index"].astype(
-        int
-    )  # 型変換
+    # 結果は float32 / int64 の配列に直接書き込む（行ごとの Series を作らない）
+    scores = np.empty((len(data), len(luke_wrime_score_columns)), dtype=np.float32)
+    indices = np.empty(len(data), dtype=np.int64)
+    for i, text in enumerate(
+        tqdm(data["snippet_displayMessage"], desc="Processing rows")
+    ):
+        with profile_stage("luke_wrime-reference-score"):
+            max_sentiment_index, sentiment_index = function(text)
+        scores[i] = sentiment_index[0]
+        indices[i] = max_sentiment_index
+
+    # 入力をコピーせず、列の追加だけで結果を組み立てる
+    with profile_stage("luke_wrime-reference-assemble"):
+        result_data = build_result_frame(data)
+        for column_index, column in enumerate(luke_wrime_score_columns):
+            result_data[column] = scores[:, column_index]
+        result_data["luke_wrime_index"] = indices
 
     return result_data
+
+
+@register_model("luke_wrime")
+class LukeWrimeEmotionModel:
+    """LUKE WRIMEを用いた感情分析モデル（EmotionModel）"""
+
+    name = "luke_wrime"
+    table_id = "luke_wrime_emotion"
+    output_schema = {
+        **{column: "float32" for column in luke_wrime_score_columns},
+        "luke_wrime_index": "int64",
+    }
+
+    def __init__(self):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        model.to(self.device)  # モデルを適切なデバイスに移動
+        model.eval()
+
+    def score(self, texts: list[str]) -> dict[str, np.ndarray]:
+        # バッチ内の最長テキストに合わせてパディングする
+        with torch.profiler.record_function("luke_wrime-tokenize"):
+            token = tokenizer(
+                texts,
+                truncation=True,
+                max_length=max_seq_length,
+                padding=True,
+                return_tensors="pt",
+            )
+            input_ids = token["input_ids"].to(self.device)
+            attention_mask = token["attention_mask"].to(self.device)
+
+        with torch.no_grad(), torch.profiler.record_function("luke_wrime-forward"):
+            logits = model(input_ids, attention_mask).logits
+        logits = logits.float().cpu().numpy()
+
+        result = {
+            column: logits[:, column_index]
+            for column_index, column in enumerate(luke_wrime_score_columns)
+        }
+        result["luke_wrime_index"] = logits.argmax(axis=1)
+        return result
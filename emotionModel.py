@@ -0,0 +1,150 @@
+from collections.abc import Callable, Sequence
+from contextlib import nullcontext
+from typing import Protocol
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from tqdm import tqdm
+
+from profileManager import profile_stage
+from util import build_result_frame
+
+default_batch_size = 32
+
+
+class EmotionModel(Protocol):
+    """
+    感情分析モデルの共通インターフェース
+
+    Attributes:
+        name (str): レジストリに登録する名前
+        table_id (str): 分析結果の書き込み先テーブルID
+        output_schema (dict[str, str]): 出力列名と dtype の対応（列順もこの順になる）
+    """
+
+    name: str
+    table_id: str
+    output_schema: dict[str, str]
+
+    def score(self, texts: list[str]) -> dict[str, Sequence]:
+        """
+        テキストのバッチを感情分析する
+
+        Args:
+            texts (list[str]): テキストのリスト
+
+        Returns:
+            dict[str, Sequence]: output_schema の列名ごとの、texts と同じ長さの結果
+        """
+        ...
+
+
+# モデル名 -> モデルを生成する関数
+_model_factories: dict[str, Callable[[], EmotionModel]] = {}
+# モデル名 -> 読み込み済みのモデル（プロセス内で使い回す）
+_model_instances: dict[str, EmotionModel] = {}
+
+
+def register_model(name: str):
+    """
+    感情分析モデルをレジストリに登録するデコレータ
+
+    Args:
+        name (str): モデル名
+
+    Returns:
+        Callable: クラス（または生成関数）をそのまま返すデコレータ
+    """
+
+    def decorator(factory: Callable[[], EmotionModel]):
+        _model_factories[name] = factory
+        return factory
+
+    return decorator
+
+
+def registered_model_names() -> list[str]:
+    """
+    登録済みのモデル名を登録順に返す関数
+
+    Returns:
+        list[str]: モデル名のリスト
+    """
+    return list(_model_factories)
+
+
+def get_model_table_id(name: str) -> str:
+    """
+    モデルを生成せずに、登録済みのモデルの書き込み先テーブルIDを返す関数
+
+    Args:
+        name (str): モデル名
+
+    Returns:
+        str: テーブルID（クラス属性 table_id）
+    """
+    if name not in _model_factories:
+        raise KeyError(f"Unknown emotion model: {name}")
+    return _model_factories[name].table_id
+
+
+def get_model(name: str) -> EmotionModel:
+    """
+    登録済みのモデルを取得する関数（初回のみ生成し、以降は同じインスタンスを返す）
+
+    Args:
+        name (str): モデル名
+
+    Returns:
+        EmotionModel: モデル
+    """
+    if name not in _model_instances:
+        if name not in _model_factories:
+            raise KeyError(f"Unknown emotion model: {name}")
+        _model_instances[name] = _model_factories[name]()
+    return _model_instances[name]
+
+
+def convert_emotion(
+    data: DataFrame, model: EmotionModel, batch_size: int = default_batch_size
+) -> DataFrame:
+    """
+    任意の感情分析モデルでデータフレームを分析する関数
+    同じテキストは一度だけ分析し、結果を使い回す
+
+    Args:
+        data (DataFrame): 入力データフレーム
+        model (EmotionModel): 感情分析モデル
+        batch_size (int): 1回の推論に渡すテキスト数
+
+    Returns:
+        DataFrame: 感情分析結果を含むデータフレーム
+    """
+
+    if data.empty:
+        return pd.DataFrame()
+
+    # 重複したテキストをまとめ、ユニークなテキストのみ分析する
+    codes, unique_texts = pd.factorize(
+        data["snippet_displayMessage"], use_na_sentinel=False
+    )
+    unique_texts = list(unique_texts)
+
+    batches = []
+    # 推論を別スレッドで行うモデル（ModelWorker 経由）は、推論するスレッド側でプロファイルする
+    profiles_score = getattr(model, "profiles_score", True)
+    for start in tqdm(
+        range(0, len(unique_texts), batch_size), desc=f"Processing batches ({model.name})"
+    ):
+        with profile_stage(f"{model.name}-score") if profiles_score else nullcontext():
+            batches.append(model.score(unique_texts[start : start + batch_size]))
+
+    # 入力をコピーせず、列の追加だけで結果を組み立てる
+    with profile_stage(f"{model.name}-assemble"):
+        result_data = build_result_frame(data)
+        for column, dtype in model.output_schema.items():
+            values = np.concatenate([np.asarray(batch[column]) for batch in batches])
+            result_data[column] = pd.array(values[codes], dtype=dtype)
+
+    return result_data
@@ -46,3 +46,15 @@ def get_project_id_from_service_account():
     with open(key_path, "r") as f:
         service_account_data = json.load(f)
     return service_account_data.get("project_id")
+
+
+def get_channel_dataset_ids():
+    """
+    環境変数 CHANNEL_DATASETS（カンマ区切り）から、処理対象のチャンネルのデータセットIDを返す関数
+    （デプロイ環境に依存しない部分のみ。例: "youtube_c7_kqMFDE8c_,youtube_xxxx_"）
+
+    Returns:
+        list[str]: データセットIDのリスト。未設定の場合は空のリスト
+    """
+    channel_datasets = os.getenv("CHANNEL_DATASETS", "")
+    return [dataset.strip() for dataset in channel_datasets.split(",") if dataset.strip()]
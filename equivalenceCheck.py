@@ -0,0 +1,267 @@
+import argparse
+import statistics
+import sys
+import time
+
+import pandas as pd
+from pandas import DataFrame
+
+from emotionBert import calc_emotion_bert, convert_emotion_bert
+from emotionLukeWrime import calc_emotion_luke_wrime, convert_emotion_luke_wrime
+from emotionModel import (
+    EmotionModel,
+    convert_emotion,
+    default_batch_size,
+    get_model,
+    registered_model_names,
+)
+from pand import diff_report
+import warning  # ignore warning messages
+
+golden_corpus_path = "golden/corpus.jsonl"
+
+# モデル名 -> 行ごとに処理する基準実装
+reference_converters = {
+    "bert": lambda data: convert_emotion_bert(data, calc_emotion_bert),
+    "luke_wrime": lambda data: convert_emotion_luke_wrime(
+        data, calc_emotion_luke_wrime
+    ),
+}
+
+# 許容誤差の既定値
+default_float_rtol = 1e-3
+default_float_atol = 1e-3
+default_max_label_flips = 0
+# 計測の前に捨てる実行で処理する行数と、計測の繰り返し回数
+default_warmup_rows = 4
+default_repeats = 3
+
+
+def load_golden_corpus(path=golden_corpus_path) -> DataFrame:
+    """
+    固定のオフラインコーパスを本番と同じ dtype で読み込む関数
+
+    Args:
+        path (str): JSONL形式のコーパスのパス
+
+    Returns:
+        DataFrame: id, snippet_publishedAt, snippet_displayMessage を含むデータフレーム
+    """
+    corpus = pd.read_json(path, lines=True, dtype=False)
+    return corpus.astype(
+        {"id": "string[pyarrow]", "snippet_displayMessage": "string[pyarrow]"}
+    ).assign(snippet_publishedAt=pd.to_datetime(corpus["snippet_publishedAt"], utc=True))
+
+
+def compare_outputs(
+    reference_data: DataFrame,
+    fast_data: DataFrame,
+    float_rtol=default_float_rtol,
+    float_atol=default_float_atol,
+    max_label_flips=default_max_label_flips,
+) -> dict:
+    """
+    基準実装と高速実装の出力を比較する関数
+    浮動小数点の列は許容誤差を超えたドリフト、それ以外の列は値の不一致（ラベルの反転）として数える
+
+    Args:
+        reference_data (DataFrame): 基準実装の出力
+        fast_data (DataFrame): 高速実装の出力
+        float_rtol (float): 浮動小数点の相対許容誤差
+        float_atol (float): 浮動小数点の絶対許容誤差
+        max_label_flips (int): 許容するラベルの反転数
+
+    Returns:
+        dict: 比較結果
+            - label_flips: ラベルの反転数
+            - drift_violations: 許容誤差を超えた浮動小数点の値の数
+            - max_abs_drift: 浮動小数点の列ごとの最大絶対誤差
+            - diff: diff_report の結果
+            - passed: 許容範囲内であれば True
+    """
+    diff = diff_report(
+        reference_data, fast_data, key="id", float_rtol=float_rtol, float_atol=float_atol
+    )
+
+    float_columns = [
+        column
+        for column in reference_data.columns
+        if column in fast_data.columns
+        and pd.api.types.is_float_dtype(reference_data[column])
+        and pd.api.types.is_float_dtype(fast_data[column])
+    ]
+    value_diff = diff["value_diff"]
+    is_float_diff = value_diff["column"].isin(float_columns)
+    label_flips = int((~is_float_diff).sum())
+    drift_violations = int(is_float_diff.sum())
+
+    # id で突き合わせて列ごとの最大絶対誤差を求める
+    reference_values = reference_data.set_index("id")[float_columns]
+    fast_values = fast_data.set_index("id")[float_columns].reindex(
+        reference_values.index
+    )
+    max_abs_drift = (
+        (reference_values.astype("float64") - fast_values.astype("float64"))
+        .abs()
+        .max()
+        .to_dict()
+    )
+
+    schema_mismatch = (
+        len(diff["cols_only_in_df1"]) > 0
+        or len(diff["cols_only_in_df2"]) > 0
+        or not diff["dtype_diff"].empty
+        or not diff["rows_only_in_df1"].empty
+        or not diff["rows_only_in_df2"].empty
+    )
+
+    return {
+        "label_flips": label_flips,
+        "drift_violations": drift_violations,
+        "max_abs_drift": max_abs_drift,
+        "diff": diff,
+        "passed": not schema_mismatch
+        and label_flips <= max_label_flips
+        and drift_violations == 0,
+    }
+
+
+def time_median(function, repeats):
+    """
+    function を repeats 回実行し、最後の結果と実行時間の中央値を返す関数
+
+    Args:
+        function (Callable[[], Any]): 計測する関数
+        repeats (int): 繰り返し回数
+
+    Returns:
+        tuple[Any, float]: 最後の結果と、実行時間の中央値（秒）
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, statistics.median(seconds)
+
+
+def run_equivalence(
+    model: EmotionModel,
+    corpus: DataFrame,
+    batch_size=default_batch_size,
+    float_rtol=default_float_rtol,
+    float_atol=default_float_atol,
+    max_label_flips=default_max_label_flips,
+    warmup_rows=default_warmup_rows,
+    repeats=default_repeats,
+) -> dict:
+    """
+    コーパスを基準実装と高速実装で処理し、ドリフトと速度向上率を返す関数
+
+    Args:
+        model (EmotionModel): 高速実装として使う感情分析モデル
+        corpus (DataFrame): 入力コーパス
+        batch_size (int): 高速実装のバッチサイズ
+        float_rtol (float): 浮動小数点の相対許容誤差
+        float_atol (float): 浮動小数点の絶対許容誤差
+        max_label_flips (int): 許容するラベルの反転数
+        warmup_rows (int): 計測の前に、両方の実装でこの行数だけ処理して捨てる
+        repeats (int): 計測の繰り返し回数（実行時間は中央値を使う）
+
+    Returns:
+        dict: compare_outputs の結果に reference_seconds, fast_seconds, speedup を加えたもの
+    """
+
+    def run_reference():
+        return reference_converters[model.name](corpus)
+
+    def run_fast():
+        return convert_emotion(corpus, model, batch_size=batch_size)
+
+    # CUDA の初期化や初回のトークナイザ呼び出しのコストを、どちらの計測にも含めない
+    warmup_corpus = corpus.head(warmup_rows)
+    reference_converters[model.name](warmup_corpus)
+    convert_emotion(warmup_corpus, model, batch_size=batch_size)
+
+    reference_data, reference_seconds = time_median(run_reference, repeats)
+    fast_data, fast_seconds = time_median(run_fast, repeats)
+
+    report = compare_outputs(
+        reference_data,
+        fast_data,
+        float_rtol=float_rtol,
+        float_atol=float_atol,
+        max_label_flips=max_label_flips,
+    )
+    report["reference_seconds"] = reference_seconds
+    report["fast_seconds"] = fast_seconds
+    report["speedup"] = reference_seconds / fast_seconds if fast_seconds > 0 else None
+    return report
+
+
+def parse_args():
+    """
+    コマンドライン引数を解析する関数
+
+    Returns:
+        argparse.Namespace: 解析結果
+    """
+    parser = argparse.ArgumentParser(
+        description="基準実装と高速実装の出力が許容誤差内で一致するかを検証する"
+    )
+    parser.add_argument(
+        "--model",
+        action="append",
+        choices=sorted(reference_converters),
+        help="検証するモデル（複数指定可、既定: 全モデル）",
+    )
+    parser.add_argument("--corpus", default=golden_corpus_path)
+    parser.add_argument("--batch-size", type=int, default=default_batch_size)
+    parser.add_argument("--rtol", type=float, default=default_float_rtol)
+    parser.add_argument("--atol", type=float, default=default_float_atol)
+    parser.add_argument(
+        "--max-label-flips", type=int, default=default_max_label_flips
+    )
+    parser.add_argument("--warmup-rows", type=int, default=default_warmup_rows)
+    parser.add_argument("--repeats", type=int, default=default_repeats)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    corpus = load_golden_corpus(args.corpus)
+    model_names = args.model or [
+        name for name in registered_model_names() if name in reference_converters
+    ]
+
+    all_passed = True
+    for name in model_names:
+        report = run_equivalence(
+            get_model(name),
+            corpus,
+            batch_size=args.batch_size,
+            float_rtol=args.rtol,
+            float_atol=args.atol,
+            max_label_flips=args.max_label_flips,
+            warmup_rows=args.warmup_rows,
+            repeats=args.repeats,
+        )
+        all_passed = all_passed and report["passed"]
+
+        speedup = f"{report['speedup']:.2f}x" if report["speedup"] else "-"
+        print(f"▶ {name}: {'PASS' if report['passed'] else 'FAIL'}")
+        print(
+            f"  reference {report['reference_seconds']:.3f}s / "
+            f"fast {report['fast_seconds']:.3f}s "
+            f"(median of {args.repeats}, speedup {speedup})"
+        )
+        print(
+            f"  label flips: {report['label_flips']}, "
+            f"drift violations: {report['drift_violations']}"
+        )
+        for column, drift in report["max_abs_drift"].items():
+            print(f"  max |drift| {column}: {drift:.3e}")
+        if not report["diff"]["value_diff"].empty:
+            print(report["diff"]["value_diff"].to_string(index=False))
+
+    sys.exit(0 if all_passed else 1)
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+from pandas import DataFrame
+
+from util import write_json_atomic
+
+default_watermark_state_path = "watermark_state.json"
+default_late_arrival_margin_minutes = 10
+
+
+class WatermarkState:
+    """
+    データセット・モデルごとに、分析し終えた最新の publishedAt（ハイウォーターマーク）を保存する状態ファイル
+    """
+
+    def __init__(self, path=default_watermark_state_path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._watermarks = json.load(f)
+        else:
+            self._watermarks = {}
+
+    def get(self, dataset_id: str, model_name: str):
+        """
+        ハイウォーターマークを返す
+
+        Args:
+            dataset_id (str): データセットID
+            model_name (str): モデル名
+
+        Returns:
+            pandas.Timestamp | None: ハイウォーターマーク（UTC）。未保存の場合は None
+        """
+        with self._lock:
+            watermark = self._watermarks.get(dataset_id, {}).get(model_name)
+        return pd.Timestamp(watermark) if watermark is not None else None
+
+    def set(self, dataset_id: str, model_name: str, watermark: pd.Timestamp):
+        """ハイウォーターマークを更新する（現在の値より古い場合は更新しない）"""
+        current = self.get(dataset_id, model_name)
+        if current is not None and watermark <= current:
+            return
+        with self._lock:
+            self._watermarks.setdefault(dataset_id, {})[model_name] = watermark.isoformat()
+            write_json_atomic(self.path, self._watermarks)
+
+
+def start_of_today(now=None):
+    """
+    今日（UTC）の 00:00 を返す関数（ハイウォーターマークが未保存の場合の開始時刻）
+
+    Args:
+        now (datetime): 現在時刻（UTC）。Noneの場合は現在時刻
+
+    Returns:
+        pandas.Timestamp: 今日の 00:00（UTC）
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    return pd.Timestamp(now).floor("D")
+
+
+def incremental_since(
+    watermark_state: WatermarkState,
+    dataset_id: str,
+    model_names: list,
+    late_arrival_margin: timedelta,
+    now=None,
+) -> dict:
+    """
+    モデルごとに、増分処理で取得を始める publishedAt を返す関数
+    （ハイウォーターマークから遅延到着の余裕を引いた時刻。未保存の場合は今日の 00:00 UTC）
+
+    Args:
+        watermark_state (WatermarkState): ハイウォーターマークの状態
+        dataset_id (str): チャンネルのデータセットID
+        model_names (list[str]): モデル名のリスト
+        late_arrival_margin (timedelta): 遅延到着を拾うための余裕
+        now (datetime): 現在時刻（UTC）。Noneの場合は現在時刻
+
+    Returns:
+        dict[str, pandas.Timestamp]: モデル名 -> 取得を始める時刻
+    """
+    since_by_model = {}
+    for name in model_names:
+        watermark = watermark_state.get(dataset_id, name)
+        since_by_model[name] = (
+            watermark - late_arrival_margin
+            if watermark is not None
+            else start_of_today(now)
+        )
+    return since_by_model
+
+
+def filter_since(live_data: DataFrame, since) -> DataFrame:
+    """
+    snippet_publishedAt が since 以降の行を返す関数（全行が該当する場合はコピーせずにそのまま返す）
+
+    Args:
+        live_data (DataFrame): Live Eventデータ
+        since (pandas.Timestamp): publishedAt の下限
+
+    Returns:
+        DataFrame: since 以降の行
+    """
+    since_mask = live_data["snippet_publishedAt"] >= since
+    if since_mask.all():
+        return live_data
+    return live_data[since_mask]
+
+
+def covered_backfill_pairs(pending: list, since_by_model: dict) -> list:
+    """
+    キューにある (日付, モデル名) のうち、増分処理の範囲（モデルごとの since 以降）に含まれる日付の組を返す関数
+
+    Args:
+        pending (list[tuple[str, str]]): キューにある (日付, モデル名) のリスト
+        since_by_model (dict[str, pandas.Timestamp]): モデル名 -> 取得を始める時刻（UTC）
+
+    Returns:
+        list[tuple[str, str]]: 範囲に含まれる (日付, モデル名) のリスト
+    """
+    return [
+        (day, name)
+        for day, name in pending
+        if name in since_by_model and day >= since_by_model[name].strftime("%Y-%m-%d")
+    ]
@@ -1,90 +1,832 @@
+import argparse
+import sys
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from google.api_core.exceptions import GoogleAPIError
 from pandas import DataFrame
 from tqdm import tqdm
-from bigquery import fetch_table_data, load_dataframe_to_bigquery
-from emotionBert import calc_emotion_bert, convert_emotion_bert
-from emotionLukeWrime import calc_emotion_luke_wrime, convert_emotion_luke_wrime
+from bigquery import (
+    configure_query_cache,
+    dry_run_query,
+    execute_query,
+    fetch_table_data,
+    load_dataframe_to_bigquery,
+)
+from emotionModel import (
+    EmotionModel,
+    convert_emotion,
+    get_model_table_id,
+    registered_model_names,
+)
+import emotionBert  # noqa: F401  モデルをレジストリに登録
+import emotionLukeWrime  # noqa: F401  モデルをレジストリに登録
+from incremental import (
+    WatermarkState,
+    covered_backfill_pairs,
+    default_late_arrival_margin_minutes,
+    default_watermark_state_path,
+    filter_since,
+    incremental_since,
+)
+from modelWorker import ModelWorker, start_model_workers
+from profileManager import configure_profiling, default_profile_batches, profile_stage
 from query import (
-    bert_emotion_data_query,
-    luke_wrime_data_query,
+    channel_dataset_id,
+    channel_dataset_ids,
+    complete_sampling_query,
+    emotion_data_query,
+    emotion_data_since_query,
     text_message_event_data_query,
-    bert_emotion_table_id,
-    luke_wrime_emotion_table_id,
+    text_message_event_data_since_query,
 )
 
-from util import get_date_range
+from sampling import BackfillQueue, default_sample_bucket, stratified_sample
+from queryCache import (
+    default_query_cache_dir,
+    default_query_cache_max_bytes,
+    default_query_cache_ttl,
+)
+from util import ParameterizedQuery, format_bytes, get_date_range, is_past_day
 import warning  # ignore warning messages
 
 
-def bert_analysis_by_day(day, live_data_day: DataFrame):
+def extract_missing_rows(live_data_day: DataFrame, existing_data: DataFrame) -> DataFrame:
+    """
+    live_data_day のうち、existing_data に id が存在しない行を抽出する関数
+    （全行が未処理の場合はコピーせずにそのまま返す）
+
+    Args:
+        live_data_day (DataFrame): その日のLive Eventデータ
+        existing_data (DataFrame): 既に感情分析済みのデータ（id列を含む）
+
+    Returns:
+        DataFrame: 未処理の行
+    """
+    if existing_data.empty:
+        return live_data_day
+
+    missing_mask = ~live_data_day["id"].isin(existing_data["id"])
+    if missing_mask.all():
+        return live_data_day
+    return live_data_day[missing_mask]
+
+
+def fetch_live_data_day(day, dataset_id: str) -> DataFrame:
     """
-    指定した日付のデータを取得し、感情分析を行い、BigQueryに保存する関数
+    BigQueryから指定した日付のLive Eventデータを取得する関数
 
     Args:
         day (str): データを取得する日付（YYYY-MM-DD形式）
+        dataset_id (str): チャンネルのデータセットID
 
     Returns:
-        None
+        DataFrame: その日のLive Eventデータ
+    """
+    # Live Eventデータは自分では書き込まないため、キャッシュできる
+    # （遅延到着の余裕を過ぎた過去日は変わらない）
+    with profile_stage("live_event-fetch"):
+        live_data_day = fetch_table_data(
+            text_message_event_data_query(day, dataset_id=dataset_id),
+            cache=True,
+            immutable=is_past_day(
+                day, timedelta(minutes=default_late_arrival_margin_minutes)
+            ),
+        )
+    tqdm.write(f"▶ [{dataset_id}] Live Event Data Length: {len(live_data_day)}")
+    return live_data_day
+
+
+def analysis_missing_rows(
+    model: EmotionModel,
+    live_data: DataFrame,
+    emotion_query: ParameterizedQuery,
+    dataset_id: str,
+    sample_per_bucket=None,
+    sample_bucket=default_sample_bucket,
+    backfill=False,
+) -> bool:
+    """
+    live_data のうち未分析の行を感情分析し、BigQueryに保存する関数（日付単位・増分処理で共通）
+
+    Args:
+        model (EmotionModel): 感情分析モデル
+        live_data (DataFrame): Live Eventデータ
+        emotion_query (ParameterizedQuery): live_data と同じ範囲の分析済みデータを取得するクエリ
+        dataset_id (str): チャンネルのデータセットID
+        sample_per_bucket (int): 指定した場合、時間帯ごとにこの行数だけ抽出して分析し、
+            sampled=True と sampling_weight を付けて保存する
+            （既に分析済みの行がある場合は、重みが時間帯の全体を表さなくなるため抽出しない）
+        sample_bucket (str): サンプリングの時間帯の幅（例: "1min"）
+        backfill (bool): True の場合、sampled=False, sampling_weight=1.0 を付けて保存する
+
+    Returns:
+        bool: サンプリングで分析しなかった行が残った場合は True
     """
 
-    # ## BERTを用いた感情分析のためのデータ取得と処理
-    # BigQueryからBERT Emotionデータを取得
-    bert_emotion_data = fetch_table_data(bert_emotion_data_query(day))
-    tqdm.write(f"▶ Number of BERT Emotion Data: {len(bert_emotion_data)}")
+    # BigQueryから分析済みデータを取得
+    with profile_stage(f"{model.name}-fetch"):
+        emotion_data = fetch_table_data(emotion_query)
+    tqdm.write(
+        f"▶ [{dataset_id}] Number of {model.name} Emotion Data: {len(emotion_data)}"
+    )
+
+    # live_data と emotion_data の id を比較して、
+    # emotion_data にない id の行を live_data から抽出
+    missing_ids_data = extract_missing_rows(live_data, emotion_data)
+    tqdm.write(f"▶ [{dataset_id}] Number of missing IDs: {len(missing_ids_data)}")
 
-    # live_data_day と bert_emotion_data の id を比較して、
-    # bert_emotion_data にない id の行を live_data_day から抽出
-    bert_missing_ids_data = live_data_day[
-        ~live_data_day["id"].isin(bert_emotion_data["id"])
-    ]
-    tqdm.write(f"▶ Number of missing IDs: {len(bert_missing_ids_data)}")
+    # 既に分析済みの行がある場合は、重みが時間帯の全体を表さないため全件を分析する
+    if sample_per_bucket is not None and not emotion_data.empty:
+        sample_per_bucket = None
+        backfill = True
 
-    # BERTを用いた感情分析の処理をし、JSONL形式に変換
-    new_bert_data = convert_emotion_bert(bert_missing_ids_data, calc_emotion_bert)
-    load_dataframe_to_bigquery(new_bert_data, bert_emotion_table_id)
-    # ##
+    # サンプリングする場合は、時間帯ごとに層化抽出した行のみ分析する
+    target_data = missing_ids_data
+    if sample_per_bucket is not None:
+        target_data, sampling_weights = stratified_sample(
+            missing_ids_data, sample_per_bucket, sample_bucket
+        )
+        tqdm.write(f"▶ [{dataset_id}] Number of sampled IDs: {len(target_data)}")
 
+    # 感情分析の処理をし、BigQueryに保存
+    new_data = convert_emotion(target_data, model)
+    if not new_data.empty and sample_per_bucket is not None:
+        new_data["sampled"] = True
+        new_data["sampling_weight"] = sampling_weights
+    elif not new_data.empty and backfill:
+        new_data["sampled"] = False
+        new_data["sampling_weight"] = np.float32(1.0)
+    load_dataframe_to_bigquery(new_data, model.table_id, dataset_id=dataset_id)
 
-def luke_wrime_analysis_by_day(day, live_data_day: DataFrame):
+    return sample_per_bucket is not None and len(target_data) < len(missing_ids_data)
+
+
+def analysis_by_day(
+    model: EmotionModel,
+    day,
+    live_data_day: DataFrame,
+    dataset_id: str,
+    sample_per_bucket=None,
+    sample_bucket=default_sample_bucket,
+    backfill_queue: BackfillQueue = None,
+    backfill=False,
+):
     """
-    指定した日付のデータを取得し、感情分析を行い、BigQueryに保存する関数
+    指定した日付の未分析データを感情分析し、BigQueryに保存する関数
 
     Args:
+        model (EmotionModel): 感情分析モデル
         day (str): データを取得する日付（YYYY-MM-DD形式）
+        live_data_day (DataFrame): その日のLive Eventデータ
+        dataset_id (str): チャンネルのデータセットID
+        sample_per_bucket (int): 指定した場合、時間帯ごとにこの行数だけ抽出して分析し、
+            sampled=True と sampling_weight を付けて保存する。残りは backfill_queue に積む
+            （既に分析済みの行がある日付は、重みが時間帯の全体を表さなくなるため抽出しない）
+        sample_bucket (str): サンプリングの時間帯の幅（例: "1min"）
+        backfill_queue (BackfillQueue): サンプリングで残した処理単位を積むキュー
+        backfill (bool): サンプリングの残りを埋める処理の場合は True
+            （sampled=False, sampling_weight=1.0 を付けて保存する）
+
+    sampling_weight の合計は常に時間帯の行数（の推定値）になる:
+        - 残りを埋める前: sampled=True の行のみで、重みは 時間帯の行数 / 抽出数
+        - 残りを埋めた後: complete_backfill がサンプル行の重みを 1.0 に書き換える
+
+    Returns:
+        None
+    """
+
+    # 分析しなかった行は後で埋める
+    if analysis_missing_rows(
+        model,
+        live_data_day,
+        emotion_data_query(model.table_id, day, dataset_id=dataset_id),
+        dataset_id,
+        sample_per_bucket=sample_per_bucket,
+        sample_bucket=sample_bucket,
+        backfill=backfill,
+    ):
+        backfill_queue.enqueue(dataset_id, day, model.name)
+
+
+def complete_backfill(
+    model: EmotionModel,
+    day,
+    live_data_day: DataFrame,
+    dataset_id: str,
+    backfill_queue: BackfillQueue,
+):
+    """
+    サンプリングで残した行を分析して保存し、サンプル行の重みを 1.0 に戻してキューから取り除く関数
+
+    Args:
+        model (EmotionModel): 感情分析モデル
+        day (str): 日付（YYYY-MM-DD形式）
+        live_data_day (DataFrame): その日のLive Eventデータ
+        dataset_id (str): チャンネルのデータセットID
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+
+    Returns:
+        None
+    """
+    analysis_by_day(model, day, live_data_day, dataset_id, backfill=True)
+    # 途中で失敗してもキューに残るため、次の実行で同じ処理をやり直せる
+    execute_query(complete_sampling_query(model.table_id, day, dataset_id=dataset_id))
+    backfill_queue.done(dataset_id, day, model.name)
+
+
+def complete_backfill_pairs(
+    dataset_id: str,
+    models: dict[str, EmotionModel],
+    backfill_queue: BackfillQueue,
+    pairs: list,
+):
+    """
+    キューにある (日付, モデル名) の残りを、日付ごとにまとめて埋める関数
+    （Live Eventデータは日付ごとに1回だけ取得する）
+
+    Args:
+        dataset_id (str): チャンネルのデータセットID
+        models (dict[str, EmotionModel]): モデル名 -> モデル
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+        pairs (list[tuple[str, str]]): 埋める (日付, モデル名) のリスト
+
+    Returns:
+        None
+    """
+    for day in sorted({day for day, _ in pairs}):
+        tqdm.write(f"▶ [{dataset_id}] Backfill: {day}")
+        live_data_day = fetch_live_data_day(day, dataset_id)
+
+        for pending_day, model_name in pairs:
+            if pending_day != day or model_name not in models:
+                continue
+            complete_backfill(
+                models[model_name], day, live_data_day, dataset_id, backfill_queue
+            )
+
+
+def process_channel(
+    dataset_id: str,
+    days: list,
+    models: dict[str, ModelWorker],
+    backfill_queue: BackfillQueue,
+    sample_per_bucket=None,
+    sample_bucket=default_sample_bucket,
+    defer_backfill=False,
+):
+    """
+    1つのチャンネルの指定した日付のデータを、共有のモデルワーカーで感情分析する関数
+    続けて、キューに残っているサンプリングの残りを埋める
+
+    Args:
+        dataset_id (str): チャンネルのデータセットID
+        days (list): 日付のリスト（YYYY-MM-DD形式）
+        models (dict[str, ModelWorker]): モデル名 -> 共有のモデルワーカー
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+        sample_per_bucket (int): サンプリングする場合の時間帯ごとの行数
+        sample_bucket (str): サンプリングの時間帯の幅
+        defer_backfill (bool): True の場合、サンプリングの残りはこの実行では埋めない
 
     Returns:
         None
     """
+    # キューにある日付は、どのモードでも残りを埋める処理（sampled=False）で分析する
+    queued = set(backfill_queue.pending(dataset_id))
 
-    # ## LUKE WRIMEを用いた感情分析のためのデータ取得と処理
-    # BigQueryからLUKE WRIMEデータを取得
-    luke_wrime_data = fetch_table_data(luke_wrime_data_query(day))
-    tqdm.write(f"▶ Number of LUKE WRIME Data: {len(luke_wrime_data)}")
+    for day in days:
+        tqdm.write(f"▶ [{dataset_id}] 実行中: {day}")
+        live_data_day = fetch_live_data_day(day, dataset_id)
 
-    # live_data_day と luke_wrime_data の id を比較して、
-    # luke_wrime_data にない id の行を live_data_day から抽出
-    luke_missing_ids_data = live_data_day[
-        ~live_data_day["id"].isin(luke_wrime_data["id"])
-    ]
-    tqdm.write(f"▶ Number of missing IDs: {len(luke_missing_ids_data)}")
+        for name, model in models.items():
+            if (day, name) in queued:
+                if not defer_backfill:
+                    complete_backfill(
+                        model, day, live_data_day, dataset_id, backfill_queue
+                    )
+                continue
+            analysis_by_day(
+                model,
+                day,
+                live_data_day,
+                dataset_id,
+                sample_per_bucket=sample_per_bucket,
+                sample_bucket=sample_bucket,
+                backfill_queue=backfill_queue,
+            )
 
-    # LUKE WRIMEを用いた感情分析の処理をし、JSONL形式に変換
-    new_luke_data = convert_emotion_luke_wrime(luke_missing_ids_data, calc_emotion_luke_wrime)
-    load_dataframe_to_bigquery(new_luke_data, luke_wrime_emotion_table_id)
-    # ##
+    if defer_backfill:
+        return
+
+    # この実行でサンプリングした日付と、days 以外の日付の残りを埋める
+    complete_backfill_pairs(
+        dataset_id, models, backfill_queue, backfill_queue.pending(dataset_id)
+    )
+
+
+def analysis_since(model: EmotionModel, since, live_data: DataFrame, dataset_id: str):
+    """
+    since 以降の未分析データを感情分析し、BigQueryに保存する関数
+
+    Args:
+        model (EmotionModel): 感情分析モデル
+        since (pandas.Timestamp): 対象とする publishedAt の下限
+        live_data (DataFrame): since 以降のLive Eventデータ
+        dataset_id (str): チャンネルのデータセットID
+
+    Returns:
+        None
+    """
+
+    # 増分処理では抽出しないため、サンプリングした日付の行と同じく重みの合計が行数になるよう
+    # sampled=False, sampling_weight=1.0 を付けて保存する
+    analysis_missing_rows(
+        model,
+        live_data,
+        emotion_data_since_query(
+            model.table_id, since.to_pydatetime(), dataset_id=dataset_id
+        ),
+        dataset_id,
+        backfill=True,
+    )
+
+
+def process_channel_incremental(
+    dataset_id: str,
+    models: dict[str, ModelWorker],
+    watermark_state: WatermarkState,
+    late_arrival_margin: timedelta,
+    backfill_queue: BackfillQueue,
+):
+    """
+    1つのチャンネルのハイウォーターマーク以降のデータのみを感情分析し、ハイウォーターマークを進める関数
+    範囲に含まれる日付がサンプリングの残りとしてキューにある場合は、先にその日付の残りを埋める
+
+    Args:
+        dataset_id (str): チャンネルのデータセットID
+        models (dict[str, ModelWorker]): モデル名 -> 共有のモデルワーカー
+        watermark_state (WatermarkState): ハイウォーターマークの状態
+        late_arrival_margin (timedelta): 遅延到着を拾うための余裕
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+
+    Returns:
+        None
+    """
+    since_by_model = incremental_since(
+        watermark_state, dataset_id, list(models), late_arrival_margin
+    )
+    since = min(since_by_model.values())
+
+    # 埋める前に増分の行だけを保存すると、サンプル行の重みが時間帯の全体を表したまま二重に数えられる
+    complete_backfill_pairs(
+        dataset_id,
+        models,
+        backfill_queue,
+        covered_backfill_pairs(backfill_queue.pending(dataset_id), since_by_model),
+    )
+
+    # 全モデルのうち最も古い時刻以降をまとめて1回だけ取得する
+    with profile_stage("live_event-fetch"):
+        live_data = fetch_table_data(
+            text_message_event_data_since_query(
+                since.to_pydatetime(), dataset_id=dataset_id
+            )
+        )
+    tqdm.write(f"▶ [{dataset_id}] Live Event Data Length since {since}: {len(live_data)}")
+
+    for name, model in models.items():
+        model_since = since_by_model[name]
+        live_data_model = filter_since(live_data, model_since)
+        analysis_since(model, model_since, live_data_model, dataset_id)
+
+        # 取得した行はすべて分析済みになったため、その最新の publishedAt まで進める
+        if not live_data_model.empty:
+            watermark_state.set(
+                dataset_id, name, live_data_model["snippet_publishedAt"].max()
+            )
+
+
+# オンデマンド料金の目安（USD / TiB、リージョンにより異なる）
+on_demand_price_per_tib = 6.25
+
+
+def planned_queries_by_day(
+    dataset_ids: list,
+    days: list,
+    model_table_ids: dict,
+    backfill_queue: BackfillQueue,
+    sample_per_bucket=None,
+    defer_backfill=False,
+) -> list:
+    """
+    日付ごとの処理（process_channel）で実行予定のクエリを返す関数
+    サンプリングの残りを埋める処理で実行するクエリ（days 以外の日付を含む）も含める
+
+    Args:
+        dataset_ids (list): チャンネルのデータセットIDのリスト
+        days (list): 日付のリスト（YYYY-MM-DD形式）
+        model_table_ids (dict[str, str]): モデル名 -> テーブルID
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+        sample_per_bucket (int): サンプリングする場合の時間帯ごとの行数
+        defer_backfill (bool): True の場合、サンプリングの残りはこの実行では埋めない
+
+    Returns:
+        list[tuple[str, ParameterizedQuery]]: (表示名, クエリ) のリスト
+    """
+    planned_queries = []
+    for dataset_id in dataset_ids:
+        queued = set(backfill_queue.pending(dataset_id))
+
+        for day in days:
+            planned_queries.append(
+                (
+                    f"[{dataset_id}] {day} live_event",
+                    text_message_event_data_query(day, dataset_id),
+                )
+            )
+            for name, table_id in model_table_ids.items():
+                planned_queries.append(
+                    (
+                        f"[{dataset_id}] {day} {table_id}",
+                        emotion_data_query(table_id, day, dataset_id),
+                    )
+                )
+                if (day, name) in queued and not defer_backfill:
+                    planned_queries.append(
+                        (
+                            f"[{dataset_id}] {day} {table_id} (complete sampling)",
+                            complete_sampling_query(table_id, day, dataset_id),
+                        )
+                    )
+
+        if defer_backfill:
+            continue
+
+        # 実行の最後に埋める処理: days 以外のキューの日付と、この実行でサンプリングする日付
+        # （この実行で初めてサンプリングする組は、sampled 列がまだテーブルにない可能性があるため
+        # 重みを戻す UPDATE はドライランしない。キューにある組のみ見積もる）
+        backfill_pairs = {(day, name) for day, name in queued if day not in days}
+        if sample_per_bucket is not None:
+            backfill_pairs |= {
+                (day, name)
+                for day in days
+                for name in model_table_ids
+                if (day, name) not in queued
+            }
+        for day in sorted({day for day, _ in backfill_pairs}):
+            planned_queries.append(
+                (
+                    f"[{dataset_id}] {day} live_event (backfill)",
+                    text_message_event_data_query(day, dataset_id),
+                )
+            )
+            for name, table_id in model_table_ids.items():
+                if (day, name) not in backfill_pairs:
+                    continue
+                planned_queries.append(
+                    (
+                        f"[{dataset_id}] {day} {table_id} (backfill)",
+                        emotion_data_query(table_id, day, dataset_id),
+                    )
+                )
+                if (day, name) in queued:
+                    planned_queries.append(
+                        (
+                            f"[{dataset_id}] {day} {table_id} (complete sampling)",
+                            complete_sampling_query(table_id, day, dataset_id),
+                        )
+                    )
+    return planned_queries
+
+
+def planned_queries_incremental(
+    dataset_ids: list,
+    model_table_ids: dict,
+    watermark_state: WatermarkState,
+    late_arrival_margin: timedelta,
+    backfill_queue: BackfillQueue,
+) -> list:
+    """
+    増分処理で実行予定のクエリを返す関数
+    範囲に含まれるキューの日付の残りを埋める処理で実行するクエリも含める
+
+    Args:
+        dataset_ids (list): チャンネルのデータセットIDのリスト
+        model_table_ids (dict[str, str]): モデル名 -> テーブルID
+        watermark_state (WatermarkState): ハイウォーターマークの状態
+        late_arrival_margin (timedelta): 遅延到着を拾うための余裕
+        backfill_queue (BackfillQueue): サンプリングの残りを管理するキュー
+
+    Returns:
+        list[tuple[str, ParameterizedQuery]]: (表示名, クエリ) のリスト
+    """
+    planned_queries = []
+    for dataset_id in dataset_ids:
+        since_by_model = incremental_since(
+            watermark_state, dataset_id, list(model_table_ids), late_arrival_margin
+        )
+        since = min(since_by_model.values())
+
+        backfill_pairs = covered_backfill_pairs(
+            backfill_queue.pending(dataset_id), since_by_model
+        )
+        for day in sorted({day for day, _ in backfill_pairs}):
+            planned_queries.append(
+                (
+                    f"[{dataset_id}] {day} live_event (backfill)",
+                    text_message_event_data_query(day, dataset_id),
+                )
+            )
+            for name, table_id in model_table_ids.items():
+                if (day, name) not in backfill_pairs:
+                    continue
+                planned_queries += [
+                    (
+                        f"[{dataset_id}] {day} {table_id} (backfill)",
+                        emotion_data_query(table_id, day, dataset_id),
+                    ),
+                    (
+                        f"[{dataset_id}] {day} {table_id} (complete sampling)",
+                        complete_sampling_query(table_id, day, dataset_id),
+                    ),
+                ]
+
+        planned_queries.append(
+            (
+                f"[{dataset_id}] since {since} live_event",
+                text_message_event_data_since_query(since.to_pydatetime(), dataset_id),
+            )
+        )
+        planned_queries += [
+            (
+                f"[{dataset_id}] since {since_by_model[name]} {table_id}",
+                emotion_data_since_query(
+                    table_id, since_by_model[name].to_pydatetime(), dataset_id
+                ),
+            )
+            for name, table_id in model_table_ids.items()
+        ]
+    return planned_queries
+
+
+def estimate_scan_bytes(planned_queries: list) -> int:
+    """
+    実行予定のクエリをドライランし、スキャンされるバイト数を表示する関数
+
+    Args:
+        planned_queries (list[tuple[str, ParameterizedQuery]]): (表示名, クエリ) のリスト
+
+    Returns:
+        int: スキャンされるバイト数の合計
+    """
+    total_bytes = 0
+    for label, query in planned_queries:
+        # 1つのクエリのドライランに失敗しても、残りの見積もりは続ける（失敗したクエリは 0 バイトとして数える）
+        try:
+            num_bytes = dry_run_query(query)
+        except GoogleAPIError as error:
+            tqdm.write(f"▶ {label}: ドライランに失敗 {error!r}")
+            continue
+        total_bytes += num_bytes
+        tqdm.write(f"▶ {label}: {format_bytes(num_bytes)}")
+
+    estimated_cost = total_bytes / 1024**4 * on_demand_price_per_tib
+    tqdm.write(
+        f"▶ Total bytes scanned: {format_bytes(total_bytes)} "
+        f"(約 ${estimated_cost:.4f}, オンデマンド料金の目安)"
+    )
+    return total_bytes
+
+
+def positive_int(value):
+    """argparse 用: 正の整数のみを受け付ける"""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value}")
+    return number
+
+
+def parse_args():
+    """
+    コマンドライン引数を解析する関数
+
+    Returns:
+        argparse.Namespace: 解析結果
+    """
+    parser = argparse.ArgumentParser(description="感情分析を行い、BigQueryに保存する")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="tokenize・推論・pandas処理などのステージをプロファイルする",
+    )
+    parser.add_argument(
+        "--profile-batches",
+        type=int,
+        default=default_profile_batches,
+        help="ステージごとにプロファイルする最初のバッチ数",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="プロファイルの出力先ディレクトリ（既定: profiles/<実行日時>）",
+    )
+    parser.add_argument(
+        "--channel",
+        action="append",
+        help="処理するチャンネルのデータセットID（環境サフィックスなし、複数指定可。"
+        "既定: 環境変数 CHANNEL_DATASETS）",
+    )
+    parser.add_argument(
+        "--max-concurrent-channels",
+        type=positive_int,
+        default=None,
+        help="同時に処理するチャンネル数（既定: 全チャンネル。推論はモデルワーカーで共有するため、"
+        "チャンネルを増やしてもモデルのメモリは増えない）",
+    )
+    parser.add_argument(
+        "--sample-per-bucket",
+        type=positive_int,
+        default=None,
+        help="指定した場合、時間帯ごとにこの行数だけ先に分析し、残りは後で埋める",
+    )
+    parser.add_argument(
+        "--sample-bucket",
+        default=default_sample_bucket,
+        help="サンプリングの時間帯の幅（pandas の頻度文字列）",
+    )
+    parser.add_argument(
+        "--defer-backfill",
+        action="store_true",
+        help="サンプリングの残りをこの実行では埋めない（後の実行で埋める）",
+    )
+    parser.add_argument(
+        "--query-cache",
+        action="store_true",
+        help="Live Eventデータのクエリ結果をローカルにキャッシュする",
+    )
+    parser.add_argument("--query-cache-dir", default=default_query_cache_dir)
+    parser.add_argument(
+        "--query-cache-ttl",
+        type=int,
+        default=default_query_cache_ttl,
+        help="キャッシュの有効期限（秒）。過去日の結果は期限切れにしない",
+    )
+    parser.add_argument(
+        "--query-cache-max-bytes",
+        type=int,
+        default=default_query_cache_max_bytes,
+        help="キャッシュの最大合計サイズ（バイト）",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="クエリをドライランしてスキャン量を表示し、分析は行わない",
+    )
+    parser.add_argument(
+        "--max-bytes-scanned",
+        type=int,
+        default=None,
+        help="スキャン量の合計がこのバイト数を超える場合は実行しない",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="日付単位ではなく、前回の実行で分析し終えた時刻（ハイウォーターマーク）以降のみを分析する",
+    )
+    parser.add_argument(
+        "--late-arrival-margin-minutes",
+        type=int,
+        default=default_late_arrival_margin_minutes,
+        help="増分処理で、ハイウォーターマークより前に遡って取得する分数（遅延到着の取りこぼし防止）",
+    )
+    parser.add_argument(
+        "--watermark-state",
+        default=default_watermark_state_path,
+        help="ハイウォーターマークを保存する状態ファイル",
+    )
+    args = parser.parse_args()
+
+    # 増分処理は日付単位の処理のみの機能と組み合わせられない
+    if args.incremental:
+        incompatible_flags = [
+            flag
+            for flag, enabled in [
+                ("--sample-per-bucket", args.sample_per_bucket is not None),
+                ("--defer-backfill", args.defer_backfill),
+                ("--query-cache", args.query_cache),
+            ]
+            if enabled
+        ]
+        if incompatible_flags:
+            parser.error(
+                f"--incremental cannot be combined with {', '.join(incompatible_flags)}"
+            )
+    return args
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.profile:
+        profile_dir = configure_profiling(args.profile_dir, args.profile_batches)
+        tqdm.write(f"▶ Profiling enabled: {profile_dir}")
+    if args.query_cache:
+        configure_query_cache(
+            args.query_cache_dir, args.query_cache_ttl, args.query_cache_max_bytes
+        )
+
     days = get_date_range(
         # "2025-02-17", "2025-08-14"
         "2025-08-14",
         "2025-08-15",
     )  # 日付範囲を取得（単一日付の場合もリストで返す）
+    dataset_ids = (
+        [channel_dataset_id(channel) for channel in args.channel]
+        if args.channel
+        else channel_dataset_ids
+    )
+
+    watermark_state = WatermarkState(args.watermark_state)
+    late_arrival_margin = timedelta(minutes=args.late_arrival_margin_minutes)
+
+    backfill_queue = BackfillQueue()
+
+    # 実行前にスキャン量を見積もり、予算を超える場合は実行しない（モデルは読み込まない）
+    if args.dry_run or args.max_bytes_scanned is not None:
+        model_table_ids = {
+            name: get_model_table_id(name) for name in registered_model_names()
+        }
+        if args.incremental:
+            planned_queries = planned_queries_incremental(
+                dataset_ids,
+                model_table_ids,
+                watermark_state,
+                late_arrival_margin,
+                backfill_queue,
+            )
+        else:
+            planned_queries = planned_queries_by_day(
+                dataset_ids,
+                days,
+                model_table_ids,
+                backfill_queue,
+                sample_per_bucket=args.sample_per_bucket,
+                defer_backfill=args.defer_backfill,
+            )
+        total_bytes = estimate_scan_bytes(planned_queries)
+        if args.max_bytes_scanned is not None and total_bytes > args.max_bytes_scanned:
+            tqdm.write(
+                f"▶ Refusing to run: {format_bytes(total_bytes)} exceeds the budget "
+                f"of {format_bytes(args.max_bytes_scanned)}"
+            )
+            sys.exit(1)
+        if args.dry_run:
+            sys.exit(0)
+
+    # モデルは1回だけ読み込み、全チャンネルで共有する
+    workers = start_model_workers(registered_model_names())
+
+    failed_dataset_ids = []
+    # 大きなチャンネルが後ろのチャンネルの開始を待たせないよう、既定では全チャンネルを同時に処理する
+    max_concurrent_channels = args.max_concurrent_channels or max(len(dataset_ids), 1)
+    with ThreadPoolExecutor(max_workers=max_concurrent_channels) as executor:
+        if args.incremental:
+            futures = {
+                executor.submit(
+                    process_channel_incremental,
+                    dataset_id,
+                    workers,
+                    watermark_state,
+                    late_arrival_margin,
+                    backfill_queue,
+                ): dataset_id
+                for dataset_id in dataset_ids
+            }
+        else:
+            futures = {
+                executor.submit(
+                    process_channel,
+                    dataset_id,
+                    days,
+                    workers,
+                    backfill_queue,
+                    sample_per_bucket=args.sample_per_bucket,
+                    sample_bucket=args.sample_bucket,
+                    defer_backfill=args.defer_backfill,
+                ): dataset_id
+                for dataset_id in dataset_ids
+            }
+        for future in as_completed(futures):
+            dataset_id = futures[future]
+            try:
+                future.result()
+                tqdm.write(f"▶ [{dataset_id}] 完了")
+            except Exception as error:
+                failed_dataset_ids.append(dataset_id)
+                tqdm.write(f"▶ [{dataset_id}] 失敗: {error!r}")
 
-    for day in tqdm(days):
-        tqdm.write(f"▶ 実行中: {day}")
-        # BigQueryからLive Eventデータを取得
-        live_data_day = fetch_table_data(text_message_event_data_query(day))
-        tqdm.write(f"▶ Live Event Data Length: {len(live_data_day)}")
+    for worker in workers.values():
+        worker.close()
 
-        bert_analysis_by_day(day, live_data_day)
-        luke_wrime_analysis_by_day(day, live_data_day)
+    if failed_dataset_ids:
+        sys.exit(1)
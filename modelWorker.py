@@ -0,0 +1,95 @@
+import threading
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import Future
+
+from emotionModel import EmotionModel, get_model
+from profileManager import profile_stage
+
+
+class ModelWorker:
+    """
+    1つの読み込み済みモデルを複数チャンネルで共有する推論ワーカー（EmotionModel として使える）
+
+    推論は専用スレッドで1バッチずつ、依頼された順に行う。
+    score は結果を待ってから戻るため、キューにはチャンネルごとに高々1バッチしかなく、
+    大きなチャンネルが他のチャンネルの推論を待たせ続けることはない。
+    """
+
+    # 推論のプロファイルはこのワーカーのスレッドで行う
+    profiles_score = False
+
+    def __init__(self, model: EmotionModel):
+        self.model = model
+        self.name = model.name
+        self.table_id = model.table_id
+        self.output_schema = model.output_schema
+        self._pending = deque()  # (texts, future) のキュー
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"model-worker-{model.name}", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, texts: list[str]) -> Future:
+        """
+        バッチをキューに追加する
+
+        Args:
+            texts (list[str]): テキストのバッチ
+
+        Returns:
+            Future: model.score(texts) の結果
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"Model worker {self.name} is closed")
+            self._pending.append((texts, future))
+            self._condition.notify()
+        return future
+
+    def score(self, texts: list[str]) -> dict[str, Sequence]:
+        return self.submit(texts).result()
+
+    def close(self):
+        """キューに残ったバッチを処理し終えてからワーカーを停止する"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            return self._pending.popleft()
+
+    def _run(self):
+        while (batch := self._next_batch()) is not None:
+            texts, future = batch
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # cProfile は有効化したスレッドしか計測しないため、推論するこのスレッドで計測する
+                with profile_stage(f"{self.name}-score"):
+                    result = self.model.score(texts)
+                future.set_result(result)
+            except Exception as error:
+                future.set_exception(error)
+
+
+def start_model_workers(model_names: list[str]) -> dict[str, ModelWorker]:
+    """
+    モデルを1回ずつ読み込み、それぞれのワーカーを起動する関数
+
+    Args:
+        model_names (list[str]): モデル名のリスト
+
+    Returns:
+        dict[str, ModelWorker]: モデル名 -> ワーカー
+    """
+    return {name: ModelWorker(get_model(name)) for name in model_names}
@@ -81,45 +81,30 @@ def diff_report(
     diff_mask = pd.DataFrame(False, index=common_idx, columns=common_cols_for_values)
     for c in common_cols_for_values:
         s1, s2 = a[c], b[c]
-        if np.issubdtype(s1.dtype, np.floating) and np.issubdtype(
-            s2.dtype, np.floating
+        if pd.api.types.is_float_dtype(s1.dtype) and pd.api.types.is_float_dtype(
+            s2.dtype
         ):
             eq = np.isclose(
-                s1.astype(float),
-                s2.astype(float),
+                s1.to_numpy(dtype=float, na_value=np.nan),
+                s2.to_numpy(dtype=float, na_value=np.nan),
                 rtol=float_rtol,
                 atol=float_atol,
                 equal_nan=True,
             )
         else:
-            eq = (s1 == s2) | (s1.isna() & s2.isna())
+            # 拡張型（string[pyarrow] など）の比較結果は NA を含みうるため bool に揃える
+            eq = ((s1 == s2) | (s1.isna() & s2.isna())).to_numpy(
+                dtype=bool, na_value=False
+            )
         diff_mask[c] = ~eq
 
     if diff_mask.any().any():
-        # “縦長”に展開：key + col + df1 + df2
-        where = diff_mask.stack()
-        idx_cols = list(a.index.names)
-        diffs = (
-            pd.DataFrame({"_diff": where})
-            .query("_diff")
-            .drop(columns="_diff")
-            .reset_index()
-            .rename(
-                columns={
-                    "level_0": idx_cols[0] if idx_cols else "index",
-                    "level_1": "column",
-                }
-            )
-        )
-        # 値を付与
-        diffs["df1"] = [
-            a.loc[tuple(r[idx_cols]) if idx_cols else r[idx_cols[0]], r["column"]]
-            for _, r in diffs.iterrows()
-        ]
-        diffs["df2"] = [
-            b.loc[tuple(r[idx_cols]) if idx_cols else r[idx_cols[0]], r["column"]]
-            for _, r in diffs.iterrows()
-        ]
+        # “縦長”に展開：key + col + df1 + df2（行ループを使わずに位置で取り出す）
+        row_pos, col_pos = np.nonzero(diff_mask.to_numpy())
+        diffs = common_idx[row_pos].to_frame(index=False)
+        diffs["column"] = np.asarray(common_cols_for_values, dtype=object)[col_pos]
+        diffs["df1"] = a.to_numpy(dtype=object)[row_pos, col_pos]
+        diffs["df2"] = b.to_numpy(dtype=object)[row_pos, col_pos]
     else:
         diffs = pd.DataFrame(columns=key + ["column", "df1", "df2"])
 
@@ -0,0 +1,174 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+default_profile_batches = 5
+default_sample_interval = 0.001  # 秒
+
+# プロファイル設定（configure_profiling で有効化するまでは何もしない）
+_profile_dir = None
+_profile_batches = default_profile_batches
+_stage_counts = defaultdict(int)
+_stage_counts_lock = threading.Lock()
+# torch.profiler は同時に1つしか動かせないため、複数チャンネルのスレッド間で直列化する
+_profile_session_lock = threading.RLock()
+
+
+def configure_profiling(profile_dir=None, max_batches=default_profile_batches):
+    """
+    プロファイルを有効化する関数
+
+    Args:
+        profile_dir (str): プロファイルの出力先ディレクトリ。Noneの場合は profiles/<実行日時>
+        max_batches (int): ステージごとにプロファイルする最初のバッチ数
+
+    Returns:
+        str: プロファイルの出力先ディレクトリ
+    """
+    global _profile_dir, _profile_batches
+
+    if profile_dir is None:
+        profile_dir = os.path.join(
+            "profiles", datetime.now().strftime("%Y%m%d-%H%M%S")
+        )
+    os.makedirs(profile_dir, exist_ok=True)
+
+    _profile_dir = profile_dir
+    _profile_batches = max_batches
+    _stage_counts.clear()
+    return profile_dir
+
+
+def profile_stage(name):
+    """
+    ステージをプロファイルするコンテキストマネージャを返す関数
+    プロファイルが無効な場合、または最初の max_batches 回を超えた場合は何もしない
+
+    Args:
+        name (str): ステージ名（出力ファイル名に使用）
+
+    Returns:
+        contextmanager: ステージを囲むコンテキストマネージャ
+    """
+    if _profile_dir is None:
+        return nullcontext()
+
+    with _stage_counts_lock:
+        if _stage_counts[name] >= _profile_batches:
+            return nullcontext()
+        _stage_counts[name] += 1
+        count = _stage_counts[name]
+    return _profile(name, count)
+
+
+class StackSampler:
+    """
+    対象スレッドのスタックを別スレッドから一定間隔で記録し、フレームグラフ用の collapsed stacks を作るサンプリングプロファイラ
+    記録量はサンプル数とスタックの深さに比例するため、計測する処理の呼び出しグラフが大きくても増えすぎない
+    """
+
+    def __init__(self, thread_id, interval=default_sample_interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stacks = defaultdict(float)  # "関数;関数;..." -> 秒
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"stack-sampler-{thread_id}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed_stacks(self, path):
+        """
+        記録したスタックを書き出す
+
+        Args:
+            path (str): 出力先のパス（各行 "関数;関数;... マイクロ秒"）
+        """
+        with open(path, "w") as f:
+            for stack, seconds in self._stacks.items():
+                microseconds = int(seconds * 1e6)
+                if microseconds > 0:
+                    f.write(f"{stack} {microseconds}\n")
+
+    def _run(self):
+        last_sampled_at = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            sampled_at = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # 前回のサンプルからの経過時間を、このスタックで過ごした時間とみなす
+            if stack:
+                self._stacks[";".join(reversed(stack))] += sampled_at - last_sampled_at
+            last_sampled_at = sampled_at
+
+
+@contextmanager
+def _profile(name, count):
+    """
+    cProfile（と torch があれば torch.profiler）でステージを計測し、ファイルに書き出す
+
+    出力ファイル:
+        <name>-<count>.pstats: cProfile の統計（snakeviz などで表示）
+        <name>-<count>.stacks.txt: StackSampler で記録したフレームグラフ用の collapsed stacks
+        <name>-<count>.trace.json: Chrome トレース（chrome://tracing, Perfetto）
+        <name>-<count>.torch_stacks.txt: torch の演算子の collapsed stacks
+    """
+    try:
+        import torch
+        import torch.profiler
+    except ImportError:
+        # BigQuery や pandas のステージは torch がなくても cProfile だけで計測できる
+        torch = None
+
+    prefix = os.path.join(_profile_dir, f"{name}-{count}")
+    python_profiler = cProfile.Profile()
+    stack_sampler = StackSampler(threading.get_ident())
+
+    with _profile_session_lock:
+        if torch is None:
+            torch_profiler = None
+            torch_context = nullcontext()
+        else:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            torch_context = torch_profiler = torch.profiler.profile(
+                activities=activities,
+                record_shapes=True,
+                with_stack=True,
+                # torch 2.x では verbose を有効にしないとスタックが記録されない
+                experimental_config=torch.profiler._ExperimentalConfig(verbose=True),
+            )
+
+        with torch_context:
+            stack_sampler.start()
+            python_profiler.enable()
+            try:
+                yield
+            finally:
+                python_profiler.disable()
+                stack_sampler.stop()
+
+        python_profiler.dump_stats(f"{prefix}.pstats")
+        stack_sampler.write_collapsed_stacks(f"{prefix}.stacks.txt")
+        if torch_profiler is not None:
+            torch_profiler.export_chrome_trace(f"{prefix}.trace.json")
+            torch_profiler.export_stacks(
+                f"{prefix}.torch_stacks.txt", "self_cpu_time_total"
+            )
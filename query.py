@@ -1,45 +1,95 @@
+from google.cloud.bigquery import ScalarQueryParameter
+
 from envManager import (
+    get_channel_dataset_ids,
     get_environment_type,
     get_project_id_from_service_account,
 )
+from util import ParameterizedQuery, day_range_parameters
 
 
 dataset_id_no_suffix = (
     "youtube_c7_kqMFDE8c_"  # データセットIDのデプロイ環境に依存しない部分
 )
 
+
+def channel_dataset_id(dataset_id_no_suffix):
+    """デプロイ環境に依存しない部分から、チャンネルのデータセットIDを作る"""
+    return f"{dataset_id_no_suffix}{get_environment_type()}"
+
+
 project_id = get_project_id_from_service_account()
-dataset_id = f"{dataset_id_no_suffix}{get_environment_type()}"
+dataset_id = channel_dataset_id(dataset_id_no_suffix)
+
+# 処理対象のチャンネルのデータセットID（CHANNEL_DATASETS 未設定の場合は dataset_id のみ）
+channel_dataset_ids = [
+    channel_dataset_id(channel) for channel in get_channel_dataset_ids()
+] or [dataset_id]
 
 live_event_table_id = "live_event"
-bert_emotion_table_id = "bert_emotion"
-luke_wrime_emotion_table_id = "luke_wrime_emotion"
 
 
-def text_message_event_data_query(day):
+# パーティション列に関数をかけず半開区間で絞り込み、パーティションの刈り込みを効かせる
+def text_message_event_data_query(day, dataset_id=dataset_id):
     get_text_message_event_data_query = f"""
     SELECT id, snippet_publishedAt, snippet_displayMessage
     FROM `{project_id}.{dataset_id}.{live_event_table_id}`
-    WHERE 
-        TIMESTAMP_TRUNC(snippet_publishedAt, DAY) = TIMESTAMP("{day}") AND
+    WHERE
+        snippet_publishedAt >= @start AND
+        snippet_publishedAt < @end AND
         snippet_type = "textMessageEvent"
     """
-    return get_text_message_event_data_query
+    return ParameterizedQuery(
+        get_text_message_event_data_query, day_range_parameters(day)
+    )
 
 
-def bert_emotion_data_query(day):
-    get_bert_emotion_data_query = f"""
+def emotion_data_query(table_id, day, dataset_id=dataset_id):
+    get_emotion_data_query = f"""
     SELECT id
-    FROM `{project_id}.{dataset_id}.{bert_emotion_table_id}`
-    WHERE TIMESTAMP_TRUNC(publishedAt, DAY) = TIMESTAMP("{day}")
+    FROM `{project_id}.{dataset_id}.{table_id}`
+    WHERE publishedAt >= @start AND publishedAt < @end
+    """
+    return ParameterizedQuery(get_emotion_data_query, day_range_parameters(day))
+
+
+def complete_sampling_query(table_id, day, dataset_id=dataset_id):
+    """
+    サンプリングの残りを埋め終えた日付の、サンプル行の重みを 1.0 に戻すクエリ（DML）
+    """
+    get_complete_sampling_query = f"""
+    UPDATE `{project_id}.{dataset_id}.{table_id}`
+    SET sampling_weight = 1.0
+    WHERE
+        publishedAt >= @start AND
+        publishedAt < @end AND
+        sampled = TRUE AND
+        sampling_weight != 1.0
+    """
+    return ParameterizedQuery(get_complete_sampling_query, day_range_parameters(day))
+
+
+def text_message_event_data_since_query(since, dataset_id=dataset_id):
+    get_text_message_event_data_since_query = f"""
+    SELECT id, snippet_publishedAt, snippet_displayMessage
+    FROM `{project_id}.{dataset_id}.{live_event_table_id}`
+    WHERE
+        snippet_publishedAt >= @since AND
+        snippet_type = "textMessageEvent"
     """
-    return get_bert_emotion_data_query
+    return ParameterizedQuery(
+        get_text_message_event_data_since_query,
+        [ScalarQueryParameter("since", "TIMESTAMP", since)],
+    )
 
 
-def luke_wrime_data_query(day):
-    get_luke_wrime_data_query = f"""
+def emotion_data_since_query(table_id, since, dataset_id=dataset_id):
+    get_emotion_data_since_query = f"""
     SELECT id
-    FROM `{project_id}.{dataset_id}.{luke_wrime_emotion_table_id}`
-    WHERE TIMESTAMP_TRUNC(publishedAt, DAY) = TIMESTAMP("{day}")
+    FROM `{project_id}.{dataset_id}.{table_id}`
+    WHERE publishedAt >= @since
     """
-    return get_luke_wrime_data_query
+    return ParameterizedQuery(
+        get_emotion_data_since_query,
+        [ScalarQueryParameter("since", "TIMESTAMP", since)],
+    )
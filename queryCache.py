@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+import time
+
+import pyarrow.parquet as pq
+from pandas import DataFrame
+
+from util import arrow_types_mapper
+
+default_query_cache_dir = ".query_cache"
+default_query_cache_ttl = 6 * 60 * 60  # 秒
+default_query_cache_max_bytes = 2 * 1024**3
+
+
+class QueryCache:
+    """
+    クエリ結果をクエリ文字列のハッシュをキーとして Parquet で保存するローカルキャッシュ
+
+    - 通常のエントリは ttl 秒を過ぎると無効になる
+    - immutable なエントリ（過去日のパーティションなど）は期限切れにならない
+    - 合計サイズが max_bytes を超えた場合、通常のエントリから最後に使われた順が古いものを削除する
+    """
+
+    def __init__(
+        self,
+        directory=default_query_cache_dir,
+        ttl=default_query_cache_ttl,
+        max_bytes=default_query_cache_max_bytes,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, query: str):
+        """
+        キャッシュされたクエリ結果を返す
+
+        Args:
+            query (str): クエリ
+
+        Returns:
+            DataFrame | None: キャッシュが有効な場合は結果、それ以外は None
+        """
+        key = self._key(query)
+        for immutable in (True, False):
+            path = self._path(key, immutable)
+            try:
+                modified_at = os.path.getmtime(path)
+                if not immutable and time.time() - modified_at > self.ttl:
+                    os.remove(path)
+                    continue
+                result_dataframe = pq.read_table(path).to_pandas(
+                    types_mapper=arrow_types_mapper
+                )
+            except FileNotFoundError:
+                continue
+            # 最後に使われた時刻を更新する（期限の判定には作成時刻 mtime を使う）
+            try:
+                os.utime(path, (time.time(), modified_at))
+            except FileNotFoundError:
+                # 読み込んだ後に他のスレッドの _evict で削除された場合も、読み込んだ結果は使える
+                pass
+            return result_dataframe
+        return None
+
+    def put(self, query: str, dataframe: DataFrame, immutable=False):
+        """
+        クエリ結果を保存する
+
+        Args:
+            query (str): クエリ
+            dataframe (DataFrame): クエリ結果
+            immutable (bool): True の場合は期限切れにしない
+        """
+        path = self._path(self._key(query), immutable)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        dataframe.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, path)
+        self._evict()
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, immutable: bool) -> str:
+        suffix = ".immutable.parquet" if immutable else ".parquet"
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".parquet"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                immutable = entry.name.endswith(".immutable.parquet")
+                entries.append((immutable, stat.st_atime, stat.st_size, entry.path))
+
+            total_bytes = sum(size for _, _, size, _ in entries)
+            # 通常のエントリ -> immutable の順に、最後に使われた時刻が古いものから削除する
+            for _, _, size, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from util import write_json_atomic
+
+default_sample_bucket = "1min"
+default_backfill_queue_path = "backfill_queue.json"
+
+
+def stratified_sample(
+    data: DataFrame, per_bucket: int, bucket=default_sample_bucket, seed=0
+) -> tuple[DataFrame, np.ndarray]:
+    """
+    snippet_publishedAt の時間帯ごとに最大 per_bucket 行を無作為に抽出する関数
+
+    Args:
+        data (DataFrame): 入力データフレーム
+        per_bucket (int): 時間帯ごとの最大抽出数
+        bucket (str): 時間帯の幅（pandas の頻度文字列。例: "1min"）
+        seed (int): 乱数シード
+
+    Returns:
+        tuple[DataFrame, numpy.ndarray]: 抽出した行と、各行の重み（時間帯の行数 / 抽出数、float32）
+    """
+    if per_bucket <= 0:
+        raise ValueError(f"per_bucket must be positive: {per_bucket}")
+
+    published_at = pd.to_datetime(data["snippet_publishedAt"], utc=True)
+    codes, _ = pd.factorize(published_at.dt.floor(bucket), use_na_sentinel=False)
+    sizes = np.bincount(codes)
+
+    # 時間帯ごとに無作為な順位を付け、先頭 per_bucket 行を残す
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(codes)), codes))
+    sorted_codes = codes[order]
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - np.searchsorted(sorted_codes, sorted_codes)
+    mask = rank < per_bucket
+
+    weights = sizes / np.minimum(sizes, per_bucket)
+    return data[mask], weights[codes[mask]].astype(np.float32)
+
+
+class BackfillQueue:
+    """
+    サンプリングで未分析のまま残した (データセット, 日付, モデル) を保存するキュー
+    後で通常の処理（未分析IDの抽出）で埋めるため、行そのものではなく処理単位だけを保存する
+    """
+
+    def __init__(self, path=default_backfill_queue_path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._entries = json.load(f)
+        else:
+            self._entries = []
+
+    def enqueue(self, dataset_id: str, day: str, model_name: str):
+        entry = {"dataset_id": dataset_id, "day": day, "model": model_name}
+        with self._lock:
+            if entry not in self._entries:
+                self._entries.append(entry)
+                write_json_atomic(self.path, self._entries)
+
+    def pending(self, dataset_id: str) -> list[tuple[str, str]]:
+        """
+        データセットの未処理の (日付, モデル名) を返す
+
+        Args:
+            dataset_id (str): データセットID
+
+        Returns:
+            list[tuple[str, str]]: (日付, モデル名) のリスト
+        """
+        with self._lock:
+            return [
+                (entry["day"], entry["model"])
+                for entry in self._entries
+                if entry["dataset_id"] == dataset_id
+            ]
+
+    def done(self, dataset_id: str, day: str, model_name: str):
+        entry = {"dataset_id": dataset_id, "day": day, "model": model_name}
+        with self._lock:
+            if entry in self._entries:
+                self._entries.remove(entry)
+                write_json_atomic(self.path, self._entries)
@@ -1,8 +1,13 @@
 import os
 import unittest
 from emotionBert import convert_emotion_bert, calc_emotion_bert_demo, calc_emotion_bert
-from emotionLukeWrime import calc_emotion_luke_wrime, convert_emotion_luke_wrime
-from envManager import is_dev_environment
+from emotionLukeWrime import (
+    calc_emotion_luke_wrime,
+    convert_emotion_luke_wrime,
+    luke_wrime_score_columns,
+)
+from emotionModel import convert_emotion
+from envManager import get_channel_dataset_ids, is_dev_environment
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -54,7 +59,9 @@ class TestDataframeToEmotionBert(unittest.TestCase):
         }
 
         df = pd.DataFrame(data)
-        destination_df = pd.DataFrame(destination_data)
+        destination_df = pd.DataFrame(destination_data).astype(
+            {"label": "string[pyarrow]", "score": "float32"}
+        )
 
         result_df = convert_emotion_bert(df, calc_emotion_bert_demo)
 
@@ -145,7 +152,9 @@ class TestBertEmotionAnalysis(unittest.TestCase):
             ],  # スコアは固定値
         }
 
-        destination_df = pd.DataFrame(destination_data)
+        destination_df = pd.DataFrame(destination_data).astype(
+            {"label": "string[pyarrow]", "score": "float32"}
+        )
         result_df = convert_emotion_bert(df, calc_emotion_bert)
 
         assert_frame_equal(result_df,destination_df, check_exact=False) # GPUとCPUで若干結果が違うため許容する 
@@ -221,7 +230,9 @@ class TestLukeWrimeEmotionAnalysis(unittest.TestCase):
             "luke_wrime_index": [0, 5, 2],
         }
 
-        destination_df = pd.DataFrame(destination_data)
+        destination_df = pd.DataFrame(destination_data).astype(
+            {column: "float32" for column in luke_wrime_score_columns}
+        )
         result_df = convert_emotion_luke_wrime(df, calc_emotion_luke_wrime)
         # pd.set_option("display.precision", 17)  # 小数点以下の表示桁数
         # pd.set_option("display.float_format", "{:.17f}".format)  # フォーマット固定
@@ -236,6 +247,515 @@ class TestLukeWrimeEmotionAnalysis(unittest.TestCase):
 
         assert_frame_equal(result_df,destination_df,check_exact=False) # GPUとCPUで若干結果が違うため許容する 
 
+class TestDataframeToJsonlTimestamp(unittest.TestCase):
+    def test_dataframe_to_jsonl_timestamp(self):
+        """datetime64 の列が ISO 8601 形式で出力されるテスト"""
+        from util import dataframe_to_jsonl
+
+        df = pd.DataFrame(
+            {
+                "id": ["a"],
+                "publishedAt": pd.to_datetime(
+                    ["2025-08-14T05:54:34.042904+00:00"], utc=True
+                ),
+            }
+        )
+
+        result_jsonl = dataframe_to_jsonl(df)
+        self.assertIn('"publishedAt":"2025-08-14T05:54:34.042904', result_jsonl)
+
+
+class DemoEmotionModel:
+    """テスト用の感情分析モデル（テキストの最初の4文字をラベル、長さの10%をスコアとする）"""
+
+    name = "demo"
+    table_id = "demo_emotion"
+    output_schema = {"label": "string[pyarrow]", "score": "float32"}
+
+    def __init__(self):
+        self.scored_texts = []
+
+    def score(self, texts):
+        self.scored_texts.extend(texts)
+        return {
+            "label": [text[:4] for text in texts],
+            "score": [round(len(text) * 0.1, 2) for text in texts],
+        }
+
+
+class TestConvertEmotion(unittest.TestCase):
+    def test_convert_emotion(self):
+        """EmotionModel を用いた共通の変換処理のテスト"""
+        data = {
+            "id": [1, 2, 3, 4],
+            "snippet_publishedAt": ["2025-08-14T05:54:34.042904+00:00"] * 4,
+            "snippet_displayMessage": ["HOGE", "HUGE", "HOGEHUGE", "HOGE"],
+        }
+        destination_data = {
+            "id": [1, 2, 3, 4],
+            "publishedAt": ["2025-08-14T05:54:34.042904+00:00"] * 4,
+            "label": ["HOGE", "HUGE", "HOGE", "HOGE"],
+            "score": [0.4, 0.4, 0.8, 0.4],
+        }
+
+        model = DemoEmotionModel()
+        result_df = convert_emotion(pd.DataFrame(data), model, batch_size=2)
+        destination_df = pd.DataFrame(destination_data).astype(
+            {"label": "string[pyarrow]", "score": "float32"}
+        )
+
+        assert_frame_equal(result_df, destination_df)
+        # 同じテキストは一度だけ分析される
+        self.assertEqual(model.scored_texts, ["HOGE", "HUGE", "HOGEHUGE"])
+
+
+class TestCompareOutputs(unittest.TestCase):
+    """基準実装と高速実装の出力比較のテスト"""
+
+    def setUp(self):
+        self.reference_df = pd.DataFrame(
+            {
+                "id": ["a", "b", "c"],
+                "label": pd.array(["HOGE", "HUGE", "HOGE"], dtype="string[pyarrow]"),
+                "score": pd.array([0.4, 0.4, 0.8], dtype="float32"),
+            }
+        )
+
+    def test_compare_outputs_within_tolerance(self):
+        """許容誤差内のドリフトは合格となるテスト"""
+        from equivalenceCheck import compare_outputs
+
+        fast_df = self.reference_df.assign(
+            score=pd.array([0.4001, 0.4, 0.8], dtype="float32")
+        )
+        report = compare_outputs(self.reference_df, fast_df, float_atol=1e-3)
+
+        self.assertTrue(report["passed"])
+        self.assertEqual(report["label_flips"], 0)
+        self.assertAlmostEqual(report["max_abs_drift"]["score"], 1e-4, places=5)
+
+    def test_compare_outputs_label_flip(self):
+        """ラベルの反転とドリフトを検出するテスト"""
+        from equivalenceCheck import compare_outputs
+
+        fast_df = self.reference_df.assign(
+            label=pd.array(["HOGE", "HOGE", "HOGE"], dtype="string[pyarrow]"),
+            score=pd.array([0.4, 0.4, 0.9], dtype="float32"),
+        )
+        report = compare_outputs(self.reference_df, fast_df)
+
+        self.assertFalse(report["passed"])
+        self.assertEqual(report["label_flips"], 1)
+        self.assertEqual(report["drift_violations"], 1)
+        self.assertEqual(
+            report["diff"]["value_diff"]["id"].tolist(), ["b", "c"]
+        )
+
+
+class TestModelWorker(unittest.TestCase):
+    def test_batches_in_submission_order(self):
+        """複数チャンネルのバッチが依頼された順に1つずつ処理されるテスト"""
+        import threading
+        from modelWorker import ModelWorker
+
+        started = threading.Event()
+        release = threading.Event()
+        model = DemoEmotionModel()
+        original_score = model.score
+
+        def blocking_score(texts):
+            if texts == ["a1"]:
+                started.set()
+                release.wait(timeout=5)
+            return original_score(texts)
+
+        model.score = blocking_score
+        worker = ModelWorker(model)
+
+        # a1 の処理中に、他のチャンネルのバッチをキューに積む
+        futures = [worker.submit(["a1"])]
+        started.wait(timeout=5)
+        futures += [worker.submit(["b1"]), worker.submit(["c1"])]
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        worker.close()
+
+        self.assertEqual(model.scored_texts, ["a1", "b1", "c1"])
+
+    def test_worker_scores_as_emotion_model(self):
+        """ModelWorker を convert_emotion に渡せるテスト"""
+        from modelWorker import ModelWorker
+
+        worker = ModelWorker(DemoEmotionModel())
+        data = pd.DataFrame(
+            {
+                "id": [1, 2],
+                "snippet_publishedAt": ["2025-08-14T05:54:34.042904+00:00"] * 2,
+                "snippet_displayMessage": ["HOGE", "HUGEHUGE"],
+            }
+        )
+        result_df = convert_emotion(data, worker)
+        worker.close()
+
+        self.assertEqual(result_df["label"].tolist(), ["HOGE", "HUGE"])
+
+
+class TestGetChannelDatasetIds(unittest.TestCase):
+    def test_get_channel_dataset_ids(self):
+        """CHANNEL_DATASETS をカンマ区切りで読み込むテスト"""
+        os.environ["CHANNEL_DATASETS"] = "youtube_a_, youtube_b_,"
+        self.assertEqual(get_channel_dataset_ids(), ["youtube_a_", "youtube_b_"])
+        del os.environ["CHANNEL_DATASETS"]
+        self.assertEqual(get_channel_dataset_ids(), [])
+
+
+class TestStratifiedSample(unittest.TestCase):
+    def test_stratified_sample(self):
+        """時間帯ごとに最大 per_bucket 行を抽出し、重みを付けるテスト"""
+        from sampling import stratified_sample
+
+        data = pd.DataFrame(
+            {
+                "id": [1, 2, 3, 4],
+                "snippet_publishedAt": pd.to_datetime(
+                    [
+                        "2025-08-14T05:54:01+00:00",
+                        "2025-08-14T05:54:20+00:00",
+                        "2025-08-14T05:54:59+00:00",
+                        "2025-08-14T05:55:10+00:00",
+                    ],
+                    utc=True,
+                ),
+                "snippet_displayMessage": ["A", "B", "C", "D"],
+            }
+        )
+
+        sample, weights = stratified_sample(data, per_bucket=2, bucket="1min")
+
+        self.assertEqual(len(sample), 3)
+        self.assertEqual(sample["id"].isin([1, 2, 3]).sum(), 2)
+        self.assertIn(4, sample["id"].tolist())
+        self.assertEqual(weights.dtype, "float32")
+        self.assertEqual(
+            sorted(weights.tolist()), [1.0, 1.5, 1.5]
+        )
+
+    def test_stratified_sample_rejects_non_positive(self):
+        """per_bucket が0以下の場合はエラーになるテスト"""
+        from sampling import stratified_sample
+
+        data = pd.DataFrame(
+            {"snippet_publishedAt": pd.to_datetime(["2025-08-14T05:54:01+00:00"], utc=True)}
+        )
+        with self.assertRaises(ValueError):
+            stratified_sample(data, per_bucket=0)
+
+
+class TestBackfillQueue(unittest.TestCase):
+    def test_backfill_queue_persists(self):
+        """キューがファイルに保存され、done で取り除かれるテスト"""
+        import tempfile
+        from sampling import BackfillQueue
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "backfill_queue.json")
+            queue = BackfillQueue(path)
+            queue.enqueue("dataset_dev", "2025-08-14", "bert")
+            queue.enqueue("dataset_dev", "2025-08-14", "bert")
+            queue.enqueue("other_dev", "2025-08-14", "bert")
+
+            reloaded = BackfillQueue(path)
+            self.assertEqual(reloaded.pending("dataset_dev"), [("2025-08-14", "bert")])
+
+            reloaded.done("dataset_dev", "2025-08-14", "bert")
+            self.assertEqual(BackfillQueue(path).pending("dataset_dev"), [])
+
+
+class TestQueryCache(unittest.TestCase):
+    """クエリ結果のローカルキャッシュのテスト"""
+
+    def setUp(self):
+        import tempfile
+
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = self.temporary_directory.name
+        self.df = pd.DataFrame(
+            {
+                "id": pd.array(["a", "b"], dtype="string[pyarrow]"),
+                "snippet_publishedAt": pd.to_datetime(
+                    ["2025-08-14T05:54:34.042904+00:00"] * 2, utc=True
+                ),
+            }
+        )
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_round_trip(self):
+        """保存した結果が dtype を保ったまま取得できるテスト"""
+        from queryCache import QueryCache
+
+        cache = QueryCache(self.directory)
+        self.assertIsNone(cache.get("SELECT 1"))
+        cache.put("SELECT 1", self.df)
+
+        assert_frame_equal(cache.get("SELECT 1"), self.df)
+        self.assertIsNone(cache.get("SELECT 2"))
+
+    def test_ttl(self):
+        """期限切れのエントリは無効になり、immutable なエントリは残るテスト"""
+        from queryCache import QueryCache
+
+        cache = QueryCache(self.directory, ttl=-1)
+        cache.put("SELECT 1", self.df)
+        cache.put("SELECT 2", self.df, immutable=True)
+
+        self.assertIsNone(cache.get("SELECT 1"))
+        assert_frame_equal(cache.get("SELECT 2"), self.df)
+
+    def test_eviction(self):
+        """最大サイズを超えた場合、通常のエントリから削除されるテスト"""
+        from queryCache import QueryCache
+
+        cache = QueryCache(self.directory, max_bytes=0)
+        cache.put("SELECT 1", self.df, immutable=True)
+        self.assertIsNone(cache.get("SELECT 1"))
+
+        cache.max_bytes = 10**9
+        cache.put("SELECT 1", self.df, immutable=True)
+        cache.put("SELECT 2", self.df)
+        cache.max_bytes = os.path.getsize(cache._path(cache._key("SELECT 1"), True))
+        cache._evict()
+
+        self.assertIsNotNone(cache.get("SELECT 1"))
+        self.assertIsNone(cache.get("SELECT 2"))
+
+
+class TestFormatBytes(unittest.TestCase):
+    def test_format_bytes(self):
+        from util import format_bytes
+
+        self.assertEqual(format_bytes(512), "512.00 B")
+        self.assertEqual(format_bytes(1536 * 1024**2), "1.50 GiB")
+        self.assertEqual(format_bytes(2 * 1024**4), "2.00 TiB")
+
+
+class TestWatermarkState(unittest.TestCase):
+    def test_watermark_state(self):
+        """ハイウォーターマークが保存され、古い値では戻らないテスト"""
+        import tempfile
+        from incremental import WatermarkState
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "watermark_state.json")
+            state = WatermarkState(path)
+            self.assertIsNone(state.get("dataset_dev", "bert"))
+
+            watermark = pd.Timestamp("2025-08-14T05:54:34.042904+00:00")
+            state.set("dataset_dev", "bert", watermark)
+            state.set("dataset_dev", "bert", watermark - pd.Timedelta(minutes=1))
+
+            reloaded = WatermarkState(path)
+            self.assertEqual(reloaded.get("dataset_dev", "bert"), watermark)
+            self.assertIsNone(reloaded.get("dataset_dev", "luke_wrime"))
+
+    def test_incremental_since(self):
+        """ハイウォーターマークから余裕を引き、未保存のモデルは今日の 00:00 UTC から始めるテスト"""
+        import tempfile
+        from datetime import datetime, timedelta, timezone
+        from incremental import WatermarkState, incremental_since
+
+        with tempfile.TemporaryDirectory() as directory:
+            state = WatermarkState(os.path.join(directory, "watermark_state.json"))
+            watermark = pd.Timestamp("2025-08-14T05:54:34+00:00")
+            state.set("dataset_dev", "bert", watermark)
+
+            since_by_model = incremental_since(
+                state,
+                "dataset_dev",
+                ["bert", "luke_wrime"],
+                timedelta(minutes=10),
+                now=datetime(2025, 8, 14, 6, 0, tzinfo=timezone.utc),
+            )
+            self.assertEqual(
+                since_by_model["bert"], pd.Timestamp("2025-08-14T05:44:34+00:00")
+            )
+            self.assertEqual(
+                since_by_model["luke_wrime"], pd.Timestamp("2025-08-14T00:00:00+00:00")
+            )
+
+    def test_covered_backfill_pairs(self):
+        """モデルごとの since 以降の日付だけが、増分処理で埋める対象になるテスト"""
+        from incremental import covered_backfill_pairs
+
+        pending = [
+            ("2025-08-13", "bert"),
+            ("2025-08-14", "bert"),
+            ("2025-08-14", "luke_wrime"),
+            ("2025-08-14", "unknown"),
+        ]
+        since_by_model = {
+            "bert": pd.Timestamp("2025-08-13T23:50:00+00:00"),
+            "luke_wrime": pd.Timestamp("2025-08-15T00:00:00+00:00"),
+        }
+
+        self.assertEqual(
+            covered_backfill_pairs(pending, since_by_model),
+            [("2025-08-13", "bert"), ("2025-08-14", "bert")],
+        )
+
+    def test_filter_since(self):
+        """since より前の行が除かれ、全行が該当する場合はそのまま返すテスト"""
+        from incremental import filter_since
+
+        live_data = pd.DataFrame(
+            {
+                "id": ["1", "2", "3"],
+                "snippet_publishedAt": pd.to_datetime(
+                    [
+                        "2025-08-14T05:40:00+00:00",
+                        "2025-08-14T05:50:00+00:00",
+                        "2025-08-14T05:55:00+00:00",
+                    ]
+                ),
+            }
+        )
+        filtered = filter_since(live_data, pd.Timestamp("2025-08-14T05:50:00+00:00"))
+        self.assertEqual(filtered["id"].tolist(), ["2", "3"])
+        self.assertIs(
+            filter_since(live_data, pd.Timestamp("2025-08-14T05:00:00+00:00")),
+            live_data,
+        )
+
+
+class TestProfileStage(unittest.TestCase):
+    """ステージのプロファイルのテスト"""
+
+    def tearDown(self):
+        import profileManager
+
+        profileManager._profile_dir = None
+
+    def test_profile_first_batches_only(self):
+        """最初の max_batches 回だけプロファイルされ、ファイルが書き出されるテスト"""
+        import tempfile
+        from profileManager import configure_profiling, profile_stage
+
+        def work():
+            return sum(i * i for i in range(100000))
+
+        with tempfile.TemporaryDirectory() as directory:
+            configure_profiling(directory, max_batches=2)
+            for _ in range(3):
+                with profile_stage("demo-assemble"):
+                    work()
+
+            for count in (1, 2):
+                self.assertTrue(
+                    os.path.exists(os.path.join(directory, f"demo-assemble-{count}.pstats"))
+                )
+                self.assertTrue(
+                    os.path.exists(
+                        os.path.join(directory, f"demo-assemble-{count}.stacks.txt")
+                    )
+                )
+            self.assertFalse(
+                os.path.exists(os.path.join(directory, "demo-assemble-3.pstats"))
+            )
+
+    def test_profile_pandas_workload(self):
+        """pandas の処理をプロファイルしても、スタックの書き出しが有限の時間とサイズで終わるテスト"""
+        import tempfile
+        import numpy as np
+        from profileManager import configure_profiling, profile_stage
+
+        rng = np.random.default_rng(0)
+        live_data = pd.DataFrame(
+            {
+                "id": [str(i) for i in range(1000)],
+                "snippet_displayMessage": [f"message {i % 97}" for i in range(1000)],
+            }
+        )
+        emotion_data = pd.DataFrame(
+            {"id": [str(i) for i in range(0, 1000, 2)], "score": rng.random(500)}
+        )
+
+        def pandas_workload(directory):
+            merged = live_data.merge(emotion_data, on="id", how="left")
+            deduplicated = pd.concat([merged, merged]).drop_duplicates()
+            path = os.path.join(directory, "workload.parquet")
+            deduplicated.to_parquet(path, index=False)
+            return pd.read_parquet(path)
+
+        with tempfile.TemporaryDirectory() as directory:
+            configure_profiling(directory, max_batches=1)
+            with profile_stage("demo-fetch"):
+                for _ in range(10):
+                    pandas_workload(directory)
+
+            stacks_path = os.path.join(directory, "demo-fetch-1.stacks.txt")
+            with open(stacks_path) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(lines)
+            self.assertLess(os.path.getsize(stacks_path), 10 * 1024**2)
+            for line in lines:
+                stack, microseconds = line.rsplit(" ", 1)
+                self.assertGreater(int(microseconds), 0)
+            self.assertTrue(any("pandas_workload (" in line for line in lines))
+
+    def test_profile_disabled(self):
+        """configure_profiling していない場合は何もしないテスト"""
+        from contextlib import nullcontext
+        from profileManager import profile_stage
+
+        self.assertIsInstance(profile_stage("demo-score"), nullcontext)
+
+
+class TestIsPastDay(unittest.TestCase):
+    def test_is_past_day(self):
+        """日付の終わりから猶予が過ぎるまでは過去日とみなさないテスト"""
+        from datetime import datetime, timedelta, timezone
+        from util import is_past_day
+
+        grace_period = timedelta(minutes=10)
+        just_after_midnight = datetime(2025, 8, 15, 0, 5, tzinfo=timezone.utc)
+        after_grace_period = datetime(2025, 8, 15, 0, 10, tzinfo=timezone.utc)
+
+        self.assertFalse(is_past_day("2025-08-14", grace_period, now=just_after_midnight))
+        self.assertTrue(is_past_day("2025-08-14", grace_period, now=after_grace_period))
+        self.assertFalse(is_past_day("2025-08-15", grace_period, now=after_grace_period))
+
+
+class TestDayRangeParameters(unittest.TestCase):
+    def test_day_range_parameters(self):
+        """日付が UTC の半開区間 [day, day+1) のパラメータになるテスト"""
+        from datetime import datetime, timezone
+        from util import day_range_parameters
+
+        start, end = day_range_parameters("2025-08-14")
+
+        self.assertEqual((start.name, start.type_), ("start", "TIMESTAMP"))
+        self.assertEqual((end.name, end.type_), ("end", "TIMESTAMP"))
+        self.assertEqual(start.value, datetime(2025, 8, 14, tzinfo=timezone.utc))
+        self.assertEqual(end.value, datetime(2025, 8, 15, tzinfo=timezone.utc))
+
+    def test_cache_key_differs_by_day(self):
+        """クエリ文字列が同じでも、日付ごとにキャッシュのキーが異なるテスト"""
+        from util import ParameterizedQuery, day_range_parameters
+
+        sql = "SELECT id FROM t WHERE publishedAt >= @start AND publishedAt < @end"
+        query_14 = ParameterizedQuery(sql, day_range_parameters("2025-08-14"))
+        query_15 = ParameterizedQuery(sql, day_range_parameters("2025-08-15"))
+
+        self.assertEqual(query_14.sql, query_15.sql)
+        self.assertNotEqual(query_14.cache_key(), query_15.cache_key())
+        self.assertEqual(
+            query_14.cache_key(),
+            ParameterizedQuery(sql, day_range_parameters("2025-08-14")).cache_key(),
+        )
+
+
 class TestGetDateRange(unittest.TestCase):
     def test_get_date_range(self):
         days = get_date_range("2025-08-11","2025-08-11")
@@ -1,5 +1,13 @@
+import json
+import os
+
+import pyarrow as pa
+import pandas as pd
 from pandas import DataFrame
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from google.cloud.bigquery import ScalarQueryParameter
 
 
 def dataframe_to_jsonl(data: DataFrame):
@@ -12,7 +20,42 @@ def dataframe_to_jsonl(data: DataFrame):
     Returns:
         str: JSONL形式の文字列
     """
-    return data.to_json(orient="records", lines=True)
+    # タイムスタンプはシリアライズ時にのみ ISO 8601 文字列へ変換する
+    return data.to_json(orient="records", lines=True, date_format="iso", date_unit="us")
+
+
+def arrow_types_mapper(arrow_type: pa.DataType):
+    """
+    Arrow の型を pandas の dtype に対応付ける関数（文字列を Arrow バックエンドにする）
+
+    Args:
+        arrow_type (pyarrow.DataType): Arrow の型
+
+    Returns:
+        pandas.StringDtype | None: 文字列型の場合は string[pyarrow]、それ以外は None（既定の変換）
+    """
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def build_result_frame(data: DataFrame) -> DataFrame:
+    """
+    入力データフレームをコピーせずに、感情分析結果の土台となるデータフレームを作成する関数
+    （snippet_displayMessage を除き、snippet_publishedAt を publishedAt に改名する）
+
+    Args:
+        data (DataFrame): 入力データフレーム
+
+    Returns:
+        DataFrame: 入力の列を参照する結果用データフレーム
+    """
+    columns = {
+        ("publishedAt" if column == "snippet_publishedAt" else column): data[column]
+        for column in data.columns
+        if column != "snippet_displayMessage"
+    }
+    return pd.DataFrame(columns, copy=False)
 
 
 def get_date_range(start_day, end_day):
@@ -36,3 +79,91 @@ def get_date_range(start_day, end_day):
         current_date += timedelta(days=1)
 
     return date_list
+
+
+def is_past_day(day, grace_period=timedelta(0), now=None):
+    """
+    指定した日付が終わり、さらに grace_period が経過したかどうかを判定する関数
+    （日付が変わった直後は遅れて届く行があるため、grace_period の間は過去日とみなさない）
+
+    Args:
+        day (str): 日付 (例: "2025-08-14")
+        grace_period (timedelta): 日付の終わり（翌日 00:00 UTC）からの猶予
+        now (datetime): 現在時刻（UTC）。Noneの場合は現在時刻
+
+    Returns:
+        bool: 翌日 00:00 UTC + grace_period を過ぎている場合は True
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    day_end = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(
+        days=1
+    )
+    return now >= day_end + grace_period
+
+
+def format_bytes(num_bytes):
+    """
+    バイト数を人が読みやすい形式に変換する関数
+
+    Args:
+        num_bytes (int): バイト数
+
+    Returns:
+        str: 変換後の文字列 (例: "1.50 GiB")
+    """
+    size = float(num_bytes)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024:
+            return f"{size:.2f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TiB"
+
+
+class ParameterizedQuery(NamedTuple):
+    """クエリ文字列とクエリパラメータの組"""
+
+    sql: str
+    parameters: list
+
+    def cache_key(self):
+        """クエリ文字列とパラメータの値から、キャッシュのキーとなる文字列を作る"""
+        values = [
+            f"{parameter.name}:{parameter.type_}={parameter.value!r}"
+            for parameter in self.parameters
+        ]
+        return "\n".join([self.sql, *values])
+
+
+def day_range_parameters(day):
+    """
+    指定した日付の [00:00, 翌日00:00) を表すクエリパラメータ @start, @end を返す関数
+
+    Args:
+        day (str): 日付 (例: "2025-08-14")
+
+    Returns:
+        list[ScalarQueryParameter]: @start, @end（UTC の TIMESTAMP）
+    """
+    start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return [
+        ScalarQueryParameter("start", "TIMESTAMP", start),
+        ScalarQueryParameter("end", "TIMESTAMP", start + timedelta(days=1)),
+    ]
+
+
+def write_json_atomic(path, data):
+    """
+    JSON ファイルを書き込む関数（書き込み途中で落ちても壊れないよう、一時ファイルから置き換える）
+
+    Args:
+        path (str): 書き込み先のパス
+        data: JSON にできる値
+
+    Returns:
+        None
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary_path, path)